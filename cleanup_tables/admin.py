@@ -1,7 +1,11 @@
+from datetime import timedelta
+
 from django.contrib import admin, messages
 
+from cleanup_tables.choices import CLEANING, INDEX_BUILDING, INDEX_VALID
 from cleanup_tables.forms import CleanUPTablesForm
-from cleanup_tables.models import CleanUPTables
+from cleanup_tables.models import CleanUPRun, CleanUPTables, CleanUPTablesArchive
+from cleanup_tables.tasks import get_task_backend
 
 
 class CleanUPTablesAdmin(admin.ModelAdmin):
@@ -12,32 +16,94 @@ class CleanUPTablesAdmin(admin.ModelAdmin):
         'date_field',
         'clean_up_rule',
         'priority',
+        'strategy',
         'sql_file',
         'created_at',
         'last_executed',
         'updated_at',
         'status',
+        'progress',
+        'deferred_reason',
         'logs_deleted',
         'total_logs_deleted',
+        'batch_size',
+        'rows_per_second',
         'errors'
     )
-    list_filter = ('status', 'priority', 'clean_up_rule')
+    list_filter = ('status', 'priority', 'strategy', 'clean_up_rule')
     raw_id_fields = ('created_by', 'updated_by')
     search_fields = ('table_name', 'date_field')
 
+    def save_model(self, request, obj, form, change):
+        super(CleanUPTablesAdmin, self).save_model(request, obj, form, change)
+        if obj.auto_index and obj.index_status != INDEX_VALID:
+            get_task_backend().enqueue('cleanup_tables.tasks.build_index', instance_id=obj.id)
+            messages.info(request, 'The index of the table is checked in background, it is cleaned when it is valid.')
+            return
+        for warning in form.warnings:
+            messages.warning(request, warning)
+
     def launch_cleanup_process(self, request, queryset):
         """
-        Launch manually the cleanup process
+        Launch manually the cleanup process in the background, see settings.CLEANUP_TABLES_TASK_BACKEND
         """
 
-        from cleanup_tables.core import CleanUPTablesManager
-
+        backend = get_task_backend()
         for query in queryset:
-            manager = CleanUPTablesManager(instance_id=query.id)
-            manager.cleanup()
-        messages.success(request, 'Cleanup process launched successfully.')
+            backend.enqueue('cleanup_tables.tasks.cleanup_table', instance_id=query.id, user_id=request.user.id)
+        messages.success(request, 'Cleanup process launched in background, its progress is shown in the list.')
 
     launch_cleanup_process.short_description = "Launch CleanUP Process"
 
+    def progress(self, obj):
+        """
+        Show the rows deleted, the current throughput and the time left of the table in execution
+        """
+
+        if obj.index_status == INDEX_BUILDING:
+            return 'Building index{0}'.format(
+                ', {0}%'.format(obj.index_progress) if obj.index_progress is not None else ''
+            )
+        if obj.status != CLEANING:
+            return '-'
+        eta = obj.get_eta()
+        return '{0}{1} rows, {2} rows/s, ETA {3}'.format(
+            obj.logs_deleted,
+            ' of ~{0}'.format(obj.estimated_rows) if obj.estimated_rows else '',
+            obj.current_rows_per_second or 0,
+            timedelta(seconds=int(eta)) if eta is not None else 'unknown'
+        )
+
+    progress.short_description = "Progress"
+
+
+class CleanUPTablesArchiveAdmin(admin.ModelAdmin):
+    list_display = ('table', 'archive_file', 'rows', 'size', 'created_at')
+    list_filter = ('table',)
+    raw_id_fields = ('table',)
+
+
+class CleanUPRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'table',
+        'strategy',
+        'status',
+        'started_at',
+        'finished_at',
+        'batches',
+        'rows_deleted',
+        'p50_batch_seconds',
+        'p95_batch_seconds',
+        'max_batch_seconds',
+        'maintenance_seconds',
+        'retries',
+        'retry_seconds',
+        'errors'
+    )
+    list_filter = ('status', 'strategy', 'table')
+    raw_id_fields = ('table',)
+
 
 admin.site.register(CleanUPTables, CleanUPTablesAdmin)
+admin.site.register(CleanUPTablesArchive, CleanUPTablesArchiveAdmin)
+admin.site.register(CleanUPRun, CleanUPRunAdmin)
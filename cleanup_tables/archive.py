@@ -0,0 +1,183 @@
+import csv
+import gzip
+import io
+import json
+import os
+import pickle
+import tempfile
+from datetime import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+
+from cleanup_tables.choices import CSV, GZIP, JSONL, ZSTD
+
+
+class CleanUPArchiver(object):
+    """
+    Class to stream the deleted rows to rotating compressed files saved in the `CleanUPTablesArchive` model.
+    Rows are fetched from the cursor in chunks and written to a temporary file, so the memory used doesn't depend on
+    the batch size.
+
+    The rows of a batch are held in a pending file until its transaction commits: `commit` writes them to the
+    archive files and `rollback` discards them, so a batch rolled back and run again is archived once.
+    """
+
+    EXTENSIONS = {CSV: 'csv', JSONL: 'jsonl', GZIP: 'gz', ZSTD: 'zst'}
+
+    def __init__(self, table, archive_format, compression, fetch_size, file_rows):
+        """
+        Create an instance with the default values.
+        Args:
+            table (CleanUPTables): Table whose rows are archived
+            archive_format (string): jsonl/csv
+            compression (string): gzip/zstd
+            fetch_size (int): Rows fetched from the cursor at once
+            file_rows (int): Rows written in each file before rotating it
+        """
+
+        self.table = table
+        self.archive_format = archive_format
+        self.compression = compression
+        self.fetch_size = fetch_size
+        self.file_rows = file_rows
+        self.columns = None
+        self._raw_file = None
+        self._file = None
+        self._writer = None
+        self._path = None
+        self._rows = 0
+        self._files = 0
+        self._pending = None
+        self.archives = []
+
+    def write(self, cursor):
+        """
+        Write the rows of an executed cursor in the pending file of the batch
+
+        Returns:
+            int: The rows written
+        """
+
+        self.columns = [column[0] for column in cursor.description]
+        if self._pending is None:
+            self._pending = tempfile.TemporaryFile()
+        rows_written = 0
+        while True:
+            rows = cursor.fetchmany(self.fetch_size)
+            if not rows:
+                break
+            pickle.dump([self._get_values(row) for row in rows], self._pending, pickle.HIGHEST_PROTOCOL)
+            rows_written += len(rows)
+        return rows_written
+
+    def commit(self):
+        """
+        Write the pending rows of a committed batch to the archive files
+        """
+
+        if self._pending is None:
+            return
+        self._pending.seek(0)
+        try:
+            while True:
+                try:
+                    rows = pickle.load(self._pending)
+                except EOFError:
+                    break
+                for row in rows:
+                    if self._file is None:
+                        self._open()
+                    self._write_row(row)
+                    self._rows += 1
+                    if self._rows >= self.file_rows:
+                        self._rotate()
+        finally:
+            self.rollback()
+
+    def rollback(self):
+        """
+        Discard the pending rows of a batch that was rolled back
+        """
+
+        if self._pending is not None:
+            self._pending.close()
+            self._pending = None
+
+    def close(self):
+        """
+        Discard the rows of a batch that didn't commit and save the file in progress
+        """
+
+        self.rollback()
+        if self._file is not None:
+            self._rotate()
+
+    def _open(self):
+        """
+        Open a new temporary compressed file
+        """
+
+        handle, self._path = tempfile.mkstemp()
+        self._raw_file = os.fdopen(handle, 'wb')
+        if self.compression == ZSTD:
+            try:
+                import zstandard
+            except ImportError:
+                raise ImproperlyConfigured('The zstandard package is required to archive with zstd compression.')
+            stream = zstandard.ZstdCompressor().stream_writer(self._raw_file)
+        else:
+            stream = gzip.GzipFile(fileobj=self._raw_file, mode='wb')
+        self._file = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        self._rows = 0
+        if self.archive_format == CSV:
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.columns)
+
+    @staticmethod
+    def _get_values(row):
+        """
+        Get the values of a row that can be written, the binary values as hexadecimal strings
+        """
+
+        return [bytes(value).hex() if isinstance(value, (bytes, memoryview)) else value for value in row]
+
+    def _write_row(self, row):
+        """
+        Write one row in the current file
+        """
+
+        if self.archive_format == CSV:
+            self._writer.writerow(row)
+        else:
+            self._file.write(json.dumps(dict(zip(self.columns, row)), cls=DjangoJSONEncoder))
+            self._file.write('\n')
+
+    def _rotate(self):
+        """
+        Close the current file and save it in the `CleanUPTablesArchive` model
+        """
+
+        from cleanup_tables.models import CleanUPTablesArchive
+
+        self._file.detach().close()
+        if not self._raw_file.closed:
+            self._raw_file.close()
+
+        self._files += 1
+        filename = '{0}_{1}_{2}.{3}.{4}'.format(
+            self.table.table_name.lower(), datetime.now().strftime('%Y%m%d%H%M%S'), self._files,
+            self.EXTENSIONS[self.archive_format], self.EXTENSIONS[self.compression]
+        )
+        try:
+            archive = CleanUPTablesArchive(table=self.table, rows=self._rows, size=os.path.getsize(self._path))
+            with open(self._path, 'rb') as _file:
+                archive.archive_file.save(filename, File(_file), save=True)
+            self.archives.append(archive)
+        finally:
+            os.remove(self._path)
+            self._raw_file = None
+            self._file = None
+            self._writer = None
+            self._path = None
@@ -0,0 +1,55 @@
+class AdaptiveBatchSize(object):
+    """
+    Class to manage the batch size from the measured latency of the delete statements
+    """
+
+    MAX_GROWTH = 2.0
+    MAX_SHRINK = 0.5
+
+    def __init__(self, size, min_size, max_size, target_seconds):
+        """
+        Create an instance with the default values.
+        Args:
+            size (int): Batch size of the first statement
+            min_size (int): Smallest batch size allowed
+            max_size (int): Biggest batch size allowed
+            target_seconds (float): Latency expected for each delete statement
+        """
+
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.target_seconds = target_seconds
+        self.size = self._bounded(size)
+
+    def update(self, rows, seconds):
+        """
+        Resize the batch in proportion to the distance between the latency measured and the target one.
+        The change is limited between `MAX_SHRINK` and `MAX_GROWTH` times the size on each statement. A batch that
+        deleted fewer rows than its size doesn't grow it, its latency doesn't tell how a full batch behaves.
+
+        Args:
+            rows (int): Rows deleted by the statement
+            seconds (float): Time spent by the statement
+        """
+
+        factor = self.target_seconds / seconds if seconds > 0 else self.MAX_GROWTH
+        factor = min(self.MAX_GROWTH, max(self.MAX_SHRINK, factor))
+        if factor > 1 and rows < self.size:
+            return self.size
+        self.size = self._bounded(self.size * factor)
+        return self.size
+
+    def shrink(self):
+        """
+        Shrink the batch by `MAX_SHRINK` after a statement that couldn't finish, e.g. it timed out
+        """
+
+        self.size = self._bounded(self.size * self.MAX_SHRINK)
+        return self.size
+
+    def _bounded(self, size):
+        """
+        Keep the size between the bounds allowed
+        """
+
+        return int(min(self.max_size, max(self.min_size, size)))
@@ -0,0 +1,123 @@
+from django.db import IntegrityError, models
+from django.db.models.deletion import get_candidate_relations_to_delete
+
+from cleanup_tables.exceptions import CascadeException
+
+
+class CleanUPCascadeMixin(object):
+    """
+    Class to delete the rows that depend on the rows of each batch through foreign keys, following their `on_delete`,
+    with set-based statements instead of the Django collector, which loads every object in memory.
+
+    The dependent rows are selected with subqueries nested down from the batch range of the table, and the statements
+    run before the batch delete in its transaction, the deepest dependents first: CASCADE deletes the rows, SET_NULL
+    clears the foreign key, PROTECT and RESTRICT fail the batch when it has dependent rows and DO_NOTHING is left to
+    the database.
+    """
+
+    CASCADE_DELETE = 'delete'
+    CASCADE_UPDATE = 'update'
+    CASCADE_CHECK = 'check'
+
+    def _has_dependents(self):
+        """
+        Validate if other tables depend on the rows of the table through foreign keys handled by the cleanup
+        """
+
+        return any(
+            relation.on_delete is not models.DO_NOTHING
+            for relation in get_candidate_relations_to_delete(self.model_class._meta)
+        )
+
+    def _delete_dependents(self, watermark_condition, params):
+        """
+        Delete or update the rows that depend on one keyset range of the table, it runs in the batch transaction
+        """
+
+        for action, sql, foreign_key in self._get_cascade_sql(watermark_condition):
+            if action != self.CASCADE_CHECK:
+                self._execute_statement(sql, params)
+            elif self._fetch_value(sql, params) is not None:
+                raise IntegrityError('The rows of the batch are protected by the foreign key {0}.'.format(foreign_key))
+
+    def _get_cascade_sql(self, watermark_condition):
+        """
+        Get the statements that handle the dependent rows of a keyset range, in the order they run. They are cached
+        for the table in execution like the batch statements.
+
+        Returns:
+            list: Tuples with the action, the statement and the foreign key
+        """
+
+        key = ('cascade', watermark_condition)
+        if key not in self._sql:
+            condition = '{0}{1} AND {2} <= %(upper_bound)s'.format(
+                self._db_condition(), watermark_condition, self._db_primary_key_name()
+            )
+            self._sql[key] = self._get_dependent_statements(self.model_class, condition, [self.model_class])
+        return self._sql[key]
+
+    @classmethod
+    def validate_dependents(cls, model):
+        """
+        Validate that the rows that depend on the rows of `model` can be handled in SQL, before the table is cleaned
+
+        Raises:
+            CascadeException: A foreign key cascades in a cycle or has an `on_delete` that can't be run in SQL
+        """
+
+        cls._get_dependent_statements(model, '1 = 1', [model])
+
+    @classmethod
+    def _get_dependent_statements(cls, model, condition, path):
+        """
+        Walk the foreign keys to `model` and get the statements for the rows that reference its rows in `condition`
+
+        Args:
+            model (Model): Model whose rows are deleted
+            condition (string): WHERE condition of the rows deleted in the table of the model
+            path (list): Models deleted from the table in execution down to `model`, to detect cycles
+        """
+
+        statements = []
+        for relation in get_candidate_relations_to_delete(model._meta):
+            on_delete = relation.on_delete
+            if on_delete is models.DO_NOTHING:
+                continue
+
+            related_model = relation.related_model
+            field = relation.field
+            rows = 'SELECT {0} FROM {1} WHERE {2}'.format(field.target_field.column, model._meta.db_table, condition)
+            if related_model._meta.db_table in [path_model._meta.db_table for path_model in path]:
+                # MySQL doesn't read the table that is modified in a subquery unless it is materialized
+                rows = 'SELECT {0} FROM ({1}) parent_rows'.format(field.target_field.column, rows)
+            related_condition = '{0} IN ({1})'.format(field.column, rows)
+            related_table = related_model._meta.db_table
+            foreign_key = '{0}.{1}'.format(related_table, field.column)
+
+            if on_delete is models.CASCADE:
+                if related_model in path:
+                    raise CascadeException(foreign_key, 'cascades in a cycle, its rows can\'t be deleted in batches')
+                statements += cls._get_dependent_statements(related_model, related_condition, path + [related_model])
+                statements.append((cls.CASCADE_DELETE, 'DELETE FROM {0} WHERE {1}'.format(
+                    related_table, related_condition
+                ), foreign_key))
+            elif on_delete is models.SET_NULL:
+                statements.append((cls.CASCADE_UPDATE, 'UPDATE {0} SET {1} = NULL WHERE {2}'.format(
+                    related_table, field.column, related_condition
+                ), foreign_key))
+            elif on_delete in (models.PROTECT, getattr(models, 'RESTRICT', models.PROTECT)):
+                statements.append((cls.CASCADE_CHECK, 'SELECT 1 FROM {0} WHERE {1} LIMIT 1'.format(
+                    related_table, related_condition
+                ), foreign_key))
+            else:
+                raise CascadeException(foreign_key, 'has an on_delete that can\'t be run in SQL')
+        return statements
+
+    def _delete_range_with_dependents(self, watermark_condition, params, delete_range):
+        """
+        Run the statements of the dependent rows and the delete of one keyset range, both in the batch transaction
+        """
+
+        self._delete_dependents(watermark_condition, params)
+        delete_range(watermark_condition, params)
@@ -22,10 +22,12 @@ NEW = 'new'
 SUCCESS = 'success'
 ERROR = 'error'
 CLEANING = 'cleaning'
+PARTIAL = 'partial'
 CLEAN_UP_STATUS_OPTIONS = (
     (NEW, 'New'),
     (CLEANING, 'Cleaning'),
     (SUCCESS, 'Success'),
+    (PARTIAL, 'Partial (time budget over)'),
     (ERROR, 'Error'),
 )
 
@@ -40,3 +42,58 @@ CLEAN_UP_PRIORITY_OPTIONS = (
     (NORMAL, 'Normal'),
     (LOW, 'Low'),
 )
+
+# -------------------------------------------------------------
+# Clean UP Strategy Options
+# -------------------------------------------------------------
+KEYSET = 'keyset'
+LEGACY = 'legacy'
+PARTITION = 'partition'
+SWAP = 'swap'
+MOVE = 'move'
+CLEAN_UP_STRATEGY_OPTIONS = (
+    (KEYSET, 'Keyset (primary key ranges)'),
+    (LEGACY, 'Legacy (ordered subquery)'),
+    (PARTITION, 'Partition (drop expired partitions)'),
+    (SWAP, 'Swap (copy the rows to keep)'),
+    (MOVE, 'Move (to the archive table)'),
+)
+
+# -------------------------------------------------------------
+# Clean UP Partition Action Options
+# -------------------------------------------------------------
+DROP = 'drop'
+DETACH = 'detach'
+CLEAN_UP_PARTITION_ACTION_OPTIONS = (
+    (DROP, 'Detach and drop'),
+    (DETACH, 'Detach only'),
+)
+
+# -------------------------------------------------------------
+# Clean UP Archive Options
+# -------------------------------------------------------------
+JSONL = 'jsonl'
+CSV = 'csv'
+CLEAN_UP_ARCHIVE_FORMAT_OPTIONS = (
+    (JSONL, 'JSON Lines'),
+    (CSV, 'CSV'),
+)
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+CLEAN_UP_ARCHIVE_COMPRESSION_OPTIONS = (
+    (GZIP, 'gzip'),
+    (ZSTD, 'zstd'),
+)
+
+# -------------------------------------------------------------
+# Clean UP Index Status Options
+# -------------------------------------------------------------
+INDEX_BUILDING = 'building'
+INDEX_VALID = 'valid'
+INDEX_FAILED = 'failed'
+CLEAN_UP_INDEX_STATUS_OPTIONS = (
+    (INDEX_BUILDING, 'Building'),
+    (INDEX_VALID, 'Valid'),
+    (INDEX_FAILED, 'Failed'),
+)
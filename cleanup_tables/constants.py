@@ -1,11 +1,43 @@
+from cleanup_tables.choices import HIGH, NORMAL, LOW
+
+
 class CleanUPTableConstants:
     """
     Class with the constants from the CleanUPTablesManager module
     """
 
-    FULL_FORMAT_DATE = '%F %T.%f'
     LIMIT_TO_CLEAN = 50000
+    MIN_BATCH_SIZE = 1000
+    MAX_BATCH_SIZE = 500000
+    TARGET_BATCH_SECONDS = 2.0
     SQL_NAME = 'sql/cleanup_process.sql'
+    SQL_KEYSET_BOUND_NAME = 'sql/cleanup_keyset_bound.sql'
+    SQL_KEYSET_NAME = 'sql/cleanup_keyset.sql'
+    SQL_KEYSET_ARCHIVE_NAME = 'sql/cleanup_keyset_archive.sql'
+    SQL_MOVE_NAME = 'sql/cleanup_move.sql'
+    SQL_MOVE_INSERT_NAME = 'sql/cleanup_move_insert.sql'
+    SQL_KEYSET_SKIP_LOCKED_NAME = 'sql/postgresql/cleanup_keyset_skip_locked.sql'
+    ARCHIVE_FETCH_SIZE = 2000
+    ARCHIVE_FILE_ROWS = 1000000
+    MAX_WORKERS = 1
+    MAX_WORKERS_PER_DATABASE = {}
+    PROBE_PAUSE_SECONDS = 5
+    MIN_SCHEDULED_SECONDS = 60
+    HISTORY_WEIGHT = 0.3
+    CADENCE_BY_PRIORITY = {
+        HIGH: 3600,
+        NORMAL: 86400,
+        LOW: 604800,
+    }
+    LOCK_NAME = 'cleanup_tables:{0}'
+    PROGRESS_SECONDS = 5
+    STALE_CLEANING_SECONDS = 3600
+    TASK_WORKERS = 1
+    LOCK_TIMEOUT = 5
+    STATEMENT_TIMEOUT = 60
+    BATCH_RETRIES = 5
+    RETRY_BACKOFF_SECONDS = 0.5
+    RETRY_MAX_BACKOFF_SECONDS = 30
 
 
 class CleanUPTableHelpTextModel:
@@ -25,3 +57,46 @@ class CleanUPTableHelpTextModel:
     SQL_FILE = "(Optional) This field can be filled in case the default SQL code changes too much for what is " \
                "needed in this configuration."
     PRIORITY = "This value can be used to define the periodicity with which certain tables are cleaned."
+    STRATEGY = "Keyset walks the expired rows by primary key ranges. Legacy runs the ordered subquery SQL, it is " \
+               "always used when a SQL file is uploaded. Partition drops the expired partitions of PostgreSQL " \
+               "tables partitioned by range on the date field. Swap copies the rows to keep into a new " \
+               "PostgreSQL table and replaces the old one. Move inserts the expired rows into the archive table " \
+               "before deleting them."
+    ARCHIVE_TABLE = "Database table, with the same columns, where the move strategy inserts the expired rows."
+    PARTITION_ACTION = "What to do with the expired partitions when the partition strategy is used."
+    SWAP_THRESHOLD = "(Optional) Expired fraction of the table, between 0 and 1, from which the keyset strategy " \
+                     "is replaced by the swap strategy, settings.CLEANUP_TABLES_SWAP_THRESHOLD by default."
+    ARCHIVE_FORMAT = "(Optional) Format of the files where the deleted rows are archived before being deleted."
+    ARCHIVE_COMPRESSION = "Compression of the archive files, zstd requires the zstandard package."
+    BATCH_SIZE = "Rows deleted by each statement, it is adjusted on every execution to reach the target seconds."
+    MIN_BATCH_SIZE = "(Optional) Smallest batch size allowed."
+    MAX_BATCH_SIZE = "(Optional) Biggest batch size allowed."
+    TARGET_BATCH_SECONDS = "(Optional) Seconds expected for each delete statement, " \
+                           "settings.CLEANUP_TABLES_TARGET_BATCH_SECONDS by default."
+    PARALLELISM = "Slices of the expired primary key range deleted at the same time with the keyset strategy."
+    DUTY_CYCLE = "(Optional) Fraction of the time spent deleting, between 0 and 1, it sleeps between batches for " \
+                 "the rest, settings.CLEANUP_TABLES_DUTY_CYCLE by default."
+    TIME_BUDGET = "(Optional) Seconds the table can be cleaned in each execution, it stops with partial status " \
+                  "after them."
+    ROWS_PER_SECOND = "Rows deleted by second, moving average of the executions used by the scheduler."
+    BACKLOG_ROWS = "Expired rows estimated to be left by the last execution."
+    BACKLOG_GROWTH = "Expired rows added by second between executions, moving average used by the scheduler."
+    CADENCE = "(Optional) Seconds between the executions of the management command, derived from the priority by " \
+              "default: 1 hour for high, 1 day for normal and 1 week for low."
+    ESTIMATED_ROWS = "Expired rows estimated by the database statistics when the execution started."
+    CURRENT_ROWS_PER_SECOND = "Rows deleted by second since the last progress update."
+    AUTO_INDEX = "Build the index on the date field and the primary key when it is missing, without blocking the " \
+                 "table. The cleanup of the table waits until the index is valid."
+    INDEX_STATUS = "Status of the index built by the auto index option."
+    INDEX_PROGRESS = "Percentage of the index built, when the database reports it."
+    INDEX_UPDATED_AT = "Last progress of the index build, a build without progress is built again."
+    MAINTENANCE_THRESHOLD = "(Optional) Fraction of the rows of the table, between 0 and 1, whose deletion runs the " \
+                            "maintenance of the table after the cleanup: VACUUM (ANALYZE) on PostgreSQL, ANALYZE " \
+                            "on MySQL and SQLite. settings.CLEANUP_TABLES_MAINTENANCE_THRESHOLD by default."
+    RECLAIM_SPACE = "Reclaim the disk space in the maintenance: OPTIMIZE TABLE on MySQL and VACUUM on SQLite, which " \
+                    "rebuild the table."
+    MAINTENANCE_SECONDS = "Seconds taken by the maintenance of the last execution."
+    INCREMENTAL = "Delete only the rows that expired since the last execution finished without errors, between its " \
+                  "cutoff date and the current one. The first execution deletes all the expired rows."
+    LAST_CUTOFF = "Cutoff date of the last incremental execution finished without errors."
+    DEFERRED_REASON = "Why the scheduler didn't clean the table in its last window."
@@ -1,55 +1,487 @@
+import copy
+import functools
+import json
+import logging
 import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import connection, transaction
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, InterfaceError, connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
 
-from cleanup_tables.choices import CLEANING, ERROR, SUCCESS
+from cleanup_tables.archive import CleanUPArchiver
+from cleanup_tables.batching import AdaptiveBatchSize
+from cleanup_tables.cascade import CleanUPCascadeMixin
+from cleanup_tables.choices import CLEANING, ERROR, INDEX_BUILDING, INDEX_FAILED, PARTIAL, SUCCESS, KEYSET, LEGACY, SWAP
 from cleanup_tables.constants import CleanUPTableConstants
-from cleanup_tables.models import CleanUPTables
+from cleanup_tables.dialects import get_dialect
+from cleanup_tables.exceptions import ArchiveException
+from cleanup_tables.indexes import CleanUPIndexMixin
+from cleanup_tables.models import CleanUPRun, CleanUPTables
+from cleanup_tables.partitions import CleanUPPartitionsMixin
+from cleanup_tables.planner import CleanUPPlannerMixin
+from cleanup_tables.scheduler import CleanUPScheduler
+from cleanup_tables.signals import batch_finished, batch_started
+from cleanup_tables.swap import CleanUPSwapMixin
+from cleanup_tables.tasks import get_task_backend
+from cleanup_tables.throttling import CleanUPThrottle, get_probes
 from cleanup_tables.utils import CommonUtilsMethodsMixin
 
+logger = logging.getLogger(__name__)
 
-class CleanUPTablesManager(CleanUPTableConstants, CommonUtilsMethodsMixin):
+
+class CleanUPTablesManager(CleanUPTableConstants, CleanUPPartitionsMixin, CleanUPSwapMixin, CleanUPPlannerMixin,
+                           CleanUPIndexMixin, CleanUPCascadeMixin, CommonUtilsMethodsMixin):
     """
     Class to manage the cleanup process
     """
 
-    def __init__(self, instance_id=None, priority=None, user_id=None):
+    def __init__(self, instance_id=None, priority=None, user_id=None, max_workers=None,
+                 max_workers_per_database=None, time_budget=None, window=None, deadline=None,
+                 only_due=False, dry_run=False):
         """
         Create an instance with the default values.
         Args:
             instance_id (integer, optional): A CleanUPTable instance ID
             priority (string, optional): high/medium/low
             user_id (int, optional): ID of the user who launch the process
+            max_workers (int, optional): Tables cleaned at the same time, settings.CLEANUP_TABLES_MAX_WORKERS
+                by default
+            max_workers_per_database (dict, optional): Tables cleaned at the same time by database alias,
+                settings.CLEANUP_TABLES_MAX_WORKERS_PER_DATABASE by default
+            time_budget (int, optional): Seconds the whole process can run, settings.CLEANUP_TABLES_RUN_TIME_BUDGET
+                by default. The table in execution when it is over stops with partial status and the rest are not
+                started.
+            window (int, optional): Seconds of the maintenance window, settings.CLEANUP_TABLES_WINDOW_SECONDS by
+                default. The scheduler fits the tables in it, see `CleanUPScheduler`.
+            deadline (datetime, optional): Date when the cleanup must be finished, the scheduler fits the tables
+                before it
+            only_due (bool, optional): Clean only the tables whose cadence passed since their last execution
+            dry_run (bool, optional): Don't delete anything, keep the plan of the first batch of each table in `plans`
         """
 
         self.instance_id = instance_id
         self.priority = priority
         self.user_id = user_id
-        self._sql = None
+        self.max_workers = max_workers or getattr(settings, 'CLEANUP_TABLES_MAX_WORKERS', self.MAX_WORKERS)
+        self.max_workers_per_database = max_workers_per_database or getattr(
+            settings, 'CLEANUP_TABLES_MAX_WORKERS_PER_DATABASE', self.MAX_WORKERS_PER_DATABASE
+        )
+        self._validate_max_workers()
+        self.time_budget = time_budget or getattr(settings, 'CLEANUP_TABLES_RUN_TIME_BUDGET', None)
+        self.window = window or getattr(settings, 'CLEANUP_TABLES_WINDOW_SECONDS', None)
+        self.deadline = deadline
+        self.only_due = only_due
+        self.dry_run = dry_run
+        self.plans = {}
+        self.run_deadline = None
+        self.window_deadline = None
+        self.progress_seconds = getattr(settings, 'CLEANUP_TABLES_PROGRESS_SECONDS', self.PROGRESS_SECONDS)
+        self.stale_seconds = getattr(settings, 'CLEANUP_TABLES_STALE_CLEANING_SECONDS', self.STALE_CLEANING_SECONDS)
+        self.claimed_status = None
+        self.progress_saved_at = None
+        self.progress_rows = 0
+        self.table_budgets = {}
+        self.deferred = {}
+        self._sql = {}
+        self.using = DEFAULT_DB_ALIAS
+        self.cursors = {}
+        self.dialect = None
         self.sql_raw = None
+        self.sql_keyset_raw = None
+        self.sql_keyset_bound_raw = None
+        self.sql_keyset_archive_raw = None
+        self.sql_move_raw = None
+        self.sql_move_insert_raw = None
+        self.archiver = None
+        self.strategy = None
+        self.parallelism = 1
+        self.slice = None
+        self.slices = []
+        self.parent = None
+        self.progress_lock = None
+        self.started_at = None
+        self.throttle = None
+        self.stopped = False
+        self.run = None
+        self.run_rows = 0
+        self.batch_latencies = []
+        self.batch_size = None
+        self.table = None
+        self.resumed = False
+        self.watermark = None
+        self.batches_done = 0
         self.model_class = None
         self.date_rule = None
+        self.previous_cutoff = None
         self.errors = None
         self.user = None
         self.logs_deleted = 0
-        self.total_events = 0
+        self.estimated_rows = None
+        self.results = {}
+
+    @property
+    def connection(self):
+        """
+        Get the connection of the database where the table in execution is cleaned
+        """
+
+        return connections[self.using]
 
     def cleanup(self):
         """
-        Process to clean the table logs data
+        Process to clean the table logs data.
+        The result of each table is saved in `results` by table name. When several tables are cleaned at the same
+        time `logs_deleted` holds the rows deleted in all of them.
+
+        The tables of different databases are always cleaned at the same time, so a slow database doesn't block the
+        others.
+
+        The tables are cleaned in the order given by the scheduler, the ones it defers are kept in `deferred` with
+        the reason. A table that fails is saved with `error` status and the others are cleaned anyway.
+        """
+
+        if self.dry_run:
+            try:
+                for table in self._get_tables_to_clean():
+                    try:
+                        self.plans[table.table_name] = self._plan_table(table)
+                    except Exception as err:
+                        self._manage_transaction(transaction_type='rollback')
+                        self.plans[table.table_name] = {'strategy': table.strategy, 'errors': '{0}'.format(err)}
+            finally:
+                self._close_cursors()
+            return
+
+        scheduler = CleanUPScheduler(
+            window=self.window, deadline=self.deadline, lanes=self.max_workers, min_seconds=self.MIN_SCHEDULED_SECONDS
+        )
+        available = scheduler.get_available_seconds()
+        budgets = [budget for budget in (self.time_budget, available) if budget is not None]
+        if budgets:
+            self.run_deadline = time.monotonic() + min(budgets)
+        if available is not None:
+            self.window_deadline = time.monotonic() + available
+
+        scheduled, deferred = scheduler.plan(self._get_tables_to_clean())
+        self._defer_tables(deferred)
+        self.table_budgets = {table.pk: budget for table, budget in scheduled if budget is not None}
+        tables = []
+        for table, _ in scheduled:
+            try:
+                tables.append((table, self._db_alias(table.get_model_class(table.table_name))))
+            except Exception as err:
+                self._fail_table(table, err)
+        databases = len(set(alias for _, alias in tables))
+        if self.max_workers > 1 or databases > 1:
+            self._cleanup_concurrently(tables, max(self.max_workers, databases))
+            return
+
+        try:
+            for table, _ in tables:
+                reason = self._get_late_start_reason()
+                if reason:
+                    self._defer_tables([(table, reason)])
+                    continue
+                self._cleanup_table(table)
+        finally:
+            self._close_cursors()
+
+    def build_indexes(self):
+        """
+        Build the missing indexes of the tables with `auto_index`, without cleaning them
+        """
+
+        try:
+            for table in self._get_tables_to_clean():
+                if not table.auto_index:
+                    continue
+                self._set_table_database(table)
+                if not self._acquire_lock(table):
+                    continue
+                try:
+                    self._ensure_index(table)
+                except Exception as err:
+                    logger.exception('Index of table %s failed', table.table_name)
+                    if table.index_status == INDEX_BUILDING:
+                        self._save_index_status(
+                            table, index_status=INDEX_FAILED, errors='The index build failed: {0}'.format(err)
+                        )
+                finally:
+                    self._release_lock(table)
+        finally:
+            self._close_cursors()
+
+    def _cleanup_table(self, table):
+        """
+        Clean one table and save its result. Any error cleaning it is saved in the table with `error` status, so it
+        doesn't stop the cleanup of the other tables.
         """
 
-        tables = self._get_tables_to_clean()
-        for table in tables:
+        self.run = None
+        try:
+            self._clean_table(table)
+        except Exception as err:
+            logger.exception('Table %s failed', table.table_name)
+            self._fail_table(table, err)
+
+    def _fail_table(self, table, err):
+        """
+        Save the error of a table that couldn't be cleaned, and of its execution when it was started
+        """
+
+        try:
+            self._manage_transaction(transaction_type='rollback')
+        except Exception:
+            pass  # The connection of the table was lost
+        errors = '{0}'.format(err)
+        CleanUPTables.objects.filter(pk=table.pk).update(status=ERROR, errors=errors)
+        if self.run is not None and self.run.table_id == table.pk:
+            CleanUPRun.objects.filter(pk=self.run.pk).update(
+                status=ERROR, errors=errors, finished_at=self.get_current_date()
+            )
+        self.results[table.table_name] = {
+            'status': ERROR, 'logs_deleted': 0, 'errors': errors, 'resumed': False, 'retries': 0
+        }
+
+    def _clean_table(self, table):
+        """
+        Clean one table. The table is skipped when another process holds its lock, and held until its index is valid
+        when it builds it. The index is built by the `build_index` task, so the other tables are cleaned meanwhile.
+        """
+
+        self._set_table_database(table)
+        if not self._acquire_lock(table):
+            logger.info('Table %s is being cleaned by another process', table.table_name)
+            self.deferred[table.table_name] = 'The table is being cleaned by another process.'
+            return
+
+        build_index = False
+        try:
+            if not self._has_valid_index(table):
+                build_index = not self._is_index_building(table)
+                self._defer_tables([(table, 'The index of the table is being built.')])
+                return
             table = self._prepare_environment(table)
             self._delete_in_bulk()
             self._finish_instance(table)
+            self._run_maintenance(table)
+        finally:
+            self._release_lock(table)
+            if build_index:
+                # The task takes the lock of the table, it is enqueued once this process releases it
+                get_task_backend().enqueue('cleanup_tables.tasks.build_index', instance_id=table.pk)
+        self.results[table.table_name] = {
+            'status': table.status,
+            'logs_deleted': self.logs_deleted,
+            'errors': self.errors,
+            'resumed': self.resumed,
+            'retries': self.retries,
+        }
+
+    def _set_table_database(self, table):
+        """
+        Set the model, the database and the dialect of a table before it is locked
+        """
+
+        self.model_class = table.get_model_class(table.table_name)
+        self.date_field = table.date_field
+        self.using = self._db_alias(self.model_class)
+        self.dialect = get_dialect(self.connection.vendor)
+
+    def _cleanup_concurrently(self, tables, max_workers):
+        """
+        Clean the tables in a pool of `max_workers` threads. A table is only started when its database has less
+        than the tables allowed in `max_workers_per_database` running, so a busy database doesn't hold the pool.
+        The tables that can't be started with nothing running are deferred, the loop never waits for nothing.
+
+        Args:
+            tables (list): Tuples with the table and the alias of its database
+            max_workers (int): Threads of the pool
+        """
+
+        pending = list(tables)
+        running = {}
+        running_by_database = Counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                reason = self._get_late_start_reason() if pending else None
+                if reason:
+                    self._defer_tables([(table, reason) for table, _ in pending])
+                    pending = []
+                for table, alias in list(pending):
+                    if len(running) >= max_workers:
+                        break
+                    if running_by_database[alias] >= self._max_workers_for_database(alias):
+                        continue
+                    pending.remove((table, alias))
+                    running_by_database[alias] += 1
+                    running[executor.submit(self._cleanup_worker, table)] = alias
+                if not running:
+                    self._defer_tables([
+                        (table, 'The limit of tables cleaned at the same time of its database allows none.')
+                        for table, _ in pending
+                    ])
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running_by_database[running.pop(future)] -= 1
+                    self.results.update(future.result())
+
+        self.logs_deleted = sum(result['logs_deleted'] for result in self.results.values())
+
+    def _cleanup_worker(self, table):
+        """
+        Clean one table in a worker thread. It uses its own manager, so the status, errors and logs_deleted of each
+        table don't mix, and its own database connection, which is closed when the table is done.
+        """
+
+        worker = self.__class__(user_id=self.user_id, max_workers=1)
+        worker.run_deadline = self.run_deadline
+        worker.table_budgets = self.table_budgets
+        worker.deferred = self.deferred
+        try:
+            worker._cleanup_table(table)
+        finally:
+            worker._close_cursors()
+            connections.close_all()
+        return worker.results
+
+    def _acquire_lock(self, table):
+        """
+        Take the advisory lock of the table in its database, so two processes never clean it at the same time.
+        It is a session lock, released by `_release_lock` or when the connection is closed. The table is read again
+        once locked, the status read before may be from a process that finished meanwhile. The backends without
+        advisory locks claim the status of the table instead, see `_claim_table`.
+        """
+
+        if not self.dialect.LOCK_SQL:
+            return self._claim_table(table)
+        if not self._try_advisory_lock(table):
+            return False
+        table.refresh_from_db()
+        return True
+
+    def _try_advisory_lock(self, table):
+        """
+        Take the advisory lock of the table without waiting, the backends without advisory locks always get it
+        """
+
+        if not self.dialect.LOCK_SQL:
+            return True
+        return bool(self._fetch_value(self.dialect.LOCK_SQL, [self._get_lock_key(table)]))
+
+    def _claim_table(self, table):
+        """
+        Set the cleaning status of the table only when it still has the status read by this process, a compare and
+        set in a single update, so two processes never clean it at the same time. A table already in cleaning
+        status is only taken, and resumed, when its progress is older than `stale_seconds`, its process is gone.
+        The status read is kept in memory to resume the table, and written back by `_release_lock` when the table
+        isn't cleaned.
+        """
+
+        now = self.get_current_date()
+        claim = CleanUPTables.objects.filter(pk=table.pk, status=table.status)
+        if table.status == CLEANING:
+            stale_at = now - timedelta(seconds=self.stale_seconds)
+            claim = claim.filter(Q(progress_updated_at__lt=stale_at) | Q(progress_updated_at__isnull=True))
+        if not claim.update(status=CLEANING, progress_updated_at=now):
+            return False
+        self.claimed_status = table.status
+        return True
+
+    def _release_lock(self, table):
+        """
+        Release the advisory lock of the table, or the status claimed by a backend without advisory locks when the
+        table wasn't cleaned
+        """
+
+        if self.claimed_status is not None:
+            CleanUPTables.objects.filter(pk=table.pk, status=CLEANING).update(status=self.claimed_status)
+            self.claimed_status = None
+        if not self.dialect.UNLOCK_SQL:
+            return
+        try:
+            self._execute_statement(self.dialect.UNLOCK_SQL, [self._get_lock_key(table)])
+        except Exception as err:
+            logger.warning('Lock of table %s was not released: %s', table.table_name, err)
+
+    def _get_lock_key(self, table):
+        """
+        Get the advisory lock key of the table
+        """
+
+        return self.dialect.get_lock_key(self.LOCK_NAME.format(table.table_name))
+
+    def _defer_tables(self, deferred):
+        """
+        Save the reason why the scheduler deferred each table
+        """
+
+        for table, reason in deferred:
+            logger.info('Table %s deferred: %s', table.table_name, reason)
+            CleanUPTables.objects.filter(pk=table.pk).update(deferred_reason=reason)
+            self.deferred[table.table_name] = reason
+
+    def _is_run_expired(self):
+        """
+        Validate if the time budget of the whole process is over
+        """
+
+        return self.run_deadline is not None and time.monotonic() >= self.run_deadline
+
+    def _get_late_start_reason(self):
+        """
+        Get the reason why a scheduled table can't start anymore, None when it can. The tables before it may take
+        longer than their history, so the time left is checked when it would start.
+        """
+
+        if self._is_run_expired():
+            return 'The time budget of the process was over before the table started.'
+        if self.window_deadline is not None and self.window_deadline - time.monotonic() < self.MIN_SCHEDULED_SECONDS:
+            return 'The window was full before the table started, the tables before it took longer than planned.'
+        return None
+
+    def _validate_max_workers(self):
+        """
+        Validate that the pool and every database allow at least one table at the same time, a limit of 0 would
+        leave its tables waiting forever
+        """
+
+        if self.max_workers < 1:
+            raise ImproperlyConfigured('The max workers must be at least 1.')
+        for alias, max_workers in self.max_workers_per_database.items():
+            if max_workers < 1:
+                raise ImproperlyConfigured('The max workers of the database "{0}" must be at least 1.'.format(alias))
+
+    def _max_workers_for_database(self, alias):
+        """
+        Get the tables of one database alias allowed to be cleaned at the same time
+        """
+
+        return self.max_workers_per_database.get(alias, self.max_workers)
+
+    @staticmethod
+    def _db_alias(model_class):
+        """
+        Get the database alias where the model is cleaned, the one the database routers use to write it
+        """
+
+        return router.db_for_write(model_class) or DEFAULT_DB_ALIAS
 
     def _get_tables_to_clean(self):
         """
-        Get CleanUPTable queryset
+        Get CleanUPTable queryset, only the tables that are due when `only_due` is set
         """
 
         params = {
@@ -59,7 +491,10 @@ class CleanUPTablesManager(CleanUPTableConstants, CommonUtilsMethodsMixin):
             params.update({'id': self.instance_id})
         elif self.priority:
             params.update({'priority': self.priority})
-        return CleanUPTables.objects.filter(**params)
+        tables = CleanUPTables.objects.filter(**params)
+        if self.only_due:
+            return [table for table in tables if table.is_due()]
+        return tables
 
     def _prepare_environment(self, table):
         """
@@ -67,41 +502,192 @@ class CleanUPTablesManager(CleanUPTableConstants, CommonUtilsMethodsMixin):
         """
 
         self._initiate_variables(table)
+        self.table = table
         self.model_class = table.get_model_class(table.table_name)
+        if self.resumed and table.watermark is not None:
+            self.watermark = self.model_class._meta.pk.to_python(table.watermark)
         self.date_rule = table.get_date()
+        self.previous_cutoff = table.get_previous_cutoff()
         self.date_field = table.date_field
-        self.total_events = self._total_data_to_delete()
+        # The estimate runs with the bind parameters of the table, the limit among them
+        self.batch_size = self._get_batch_size(table)
+        self.estimated_rows = self._estimate_data_to_delete()
+        self.started_at = time.monotonic()
+        self.progress_saved_at = None
+        self.progress_rows = self.logs_deleted
+        self.has_dependents = self._has_dependents()
+        # The rows skipped by an incremental table would be left behind its next cutoff for good
+        self.skip_locked = self.dialect.SKIP_LOCKED and not self.has_dependents and not table.incremental and getattr(
+            settings, 'CLEANUP_TABLES_SKIP_LOCKED', True
+        )
+        self.lock_timeout = getattr(settings, 'CLEANUP_TABLES_LOCK_TIMEOUT', self.LOCK_TIMEOUT)
+        self.statement_timeout = getattr(settings, 'CLEANUP_TABLES_STATEMENT_TIMEOUT', self.STATEMENT_TIMEOUT)
+        self.max_batch_retries = getattr(settings, 'CLEANUP_TABLES_BATCH_RETRIES', self.BATCH_RETRIES)
+        self.batch_retries = 0
+        self.retry_batch = False
+        self.strategy = self._get_strategy(table)
+        # The legacy statement would return the archived rows of a batch at once, the keyset one streams them
+        if self.strategy == LEGACY and (self.has_dependents or table.archive_format) and not table.sql_file:
+            self.strategy = KEYSET
+        if self.strategy == KEYSET and self._should_swap(table):
+            self.strategy = SWAP
+        self.parallelism = table.parallelism
+        self.throttle = self._get_throttle(table)
         self.sql_raw = self._open_sql_file(table.sql_file)
+        self.sql_keyset_raw = self._open_sql_file(None, self.SQL_KEYSET_NAME)
+        self.sql_keyset_bound_raw = self._open_sql_file(None, self.SQL_KEYSET_BOUND_NAME)
+        self.sql_keyset_archive_raw = self._open_sql_file(None, self.SQL_KEYSET_ARCHIVE_NAME)
+        self.sql_move_raw = self._open_sql_file(None, self.SQL_MOVE_NAME)
+        self.sql_move_insert_raw = self._open_sql_file(None, self.SQL_MOVE_INSERT_NAME)
+        self.sql_keyset_skip_locked_raw = self._open_sql_file(
+            None, self.SQL_KEYSET_SKIP_LOCKED_NAME
+        ) if self.skip_locked else None
         self.user = self._get_user()
+        self.run_rows = self.logs_deleted
+        self.run = CleanUPRun.objects.create(
+            table=table, strategy=self.strategy, resumed=self.resumed, started_at=self.get_current_date()
+        )
         return table
 
+    def _get_batch_size(self, table):
+        """
+        Get the adaptive batch size, it starts from the size reached in the last execution of the table
+        """
+
+        return AdaptiveBatchSize(
+            size=table.batch_size or self.LIMIT_TO_CLEAN,
+            min_size=table.min_batch_size or self.MIN_BATCH_SIZE,
+            max_size=table.max_batch_size or self.MAX_BATCH_SIZE,
+            target_seconds=table.target_batch_seconds or getattr(
+                settings, 'CLEANUP_TABLES_TARGET_BATCH_SECONDS', self.TARGET_BATCH_SECONDS
+            )
+        )
+
+    def _get_throttle(self, table):
+        """
+        Get the throttle that paces the batches of the table. Its deadline is the first one of the table time budget
+        and the process time budget.
+        """
+
+        deadlines = [self.run_deadline] + [
+            time.monotonic() + budget for budget in (table.time_budget, self.table_budgets.get(table.pk)) if budget
+        ]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        return CleanUPThrottle(
+            probes=get_probes(),
+            duty_cycle=table.duty_cycle or getattr(settings, 'CLEANUP_TABLES_DUTY_CYCLE', None),
+            pause_seconds=getattr(settings, 'CLEANUP_TABLES_PROBE_PAUSE_SECONDS', self.PROBE_PAUSE_SECONDS),
+            deadline=min(deadlines) if deadlines else None
+        )
+
+    @staticmethod
+    def _get_strategy(table):
+        """
+        Get the deletion strategy. A custom SQL file only follows the legacy placeholders, so it forces that strategy.
+        """
+
+        if table.sql_file:
+            return LEGACY
+        return table.strategy
+
     def _initiate_variables(self, table):
         """
         Set 'cleaning' status to the table instance.
         Initialize `error` and `logs_deleted` variables.
+
+        A table that is still in 'cleaning' status was interrupted before finishing its last execution, so it keeps
+        the rows deleted, the batches done and the watermark saved after its last batch to resume from there.
         """
 
         self.errors = None
         self.model_class = None
         self.date_rule = None
-        self.logs_deleted = 0
-        self.total_events = 0
+        self.previous_cutoff = None
+        self.estimated_rows = None
+        self.slice = None
+        self.slices = []
+        self.stopped = False
+        self.batch_latencies = []
+        self.retries = 0
+        self.retry_seconds = 0.0
+        self._sql = {}
+        self.watermark = None
+        self.resumed = table.status == CLEANING
+        self.claimed_status = None
+        if self.resumed:
+            logger.warning(
+                'Table %s was interrupted after %s batches, resuming from watermark %s',
+                table.table_name, table.batches_done, table.watermark
+            )
+        else:
+            table.logs_deleted = 0
+            table.batches_done = 0
+            table.watermark = None
+        self.logs_deleted = table.logs_deleted
+        self.batches_done = table.batches_done
         table.status = CLEANING
         table.errors = None
         table.save()
         return table
 
-    def _total_data_to_delete(self):
+    def _estimate_data_to_delete(self):
         """
-        Get from model the total data to delete during the process and define the number of times the sql
-        will be called according to the limit allowed in the CleanUPTableConstants.LIMIT_TO_CLEAN constant
+        Get an estimate of the rows to delete from the planner statistics, used only to report the progress.
+        The process doesn't depend on it, it keeps deleting until the table is drained.
+
+        Returns:
+            int: The estimated rows, None when the database backend has no cheap estimate.
         """
 
-        date_field = '{0}__lte'.format(self.date_field)
-        total_data = self.model_class.objects.filter(**{date_field: self.date_rule}).count()
-        if total_data:
-            return int(round((total_data / self.LIMIT_TO_CLEAN), 0)) + 1
-        return 0
+        estimate = getattr(self, '_estimate_data_to_delete_{0}'.format(self.connection.vendor), None)
+        if estimate is None:
+            return None
+        try:
+            return estimate()
+        except Exception:
+            self._manage_transaction(transaction_type='rollback')
+            return None
+
+    def _estimate_data_to_delete_postgresql(self):
+        """
+        Get the rows estimated by the PostgreSQL planner for the expired rows, `pg_class.reltuples` when it has none
+        """
+
+        sql = 'EXPLAIN (FORMAT JSON) SELECT {0} FROM {1} WHERE {2}'.format(
+            self._db_primary_key_name(), self._db_table_name(), self._db_condition()
+        )
+        plan = self._fetch_value(sql, self._db_params())
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        if plan:
+            return int(plan[0]['Plan']['Plan Rows'])
+
+        return self._db_table_rows()
+
+    def _db_table_rows(self):
+        """
+        Get the rows of the whole table from the PostgreSQL statistics, None when the table was never analyzed
+        """
+
+        reltuples = self._fetch_value(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [self._db_table_name()]
+        )
+        return int(reltuples) if reltuples and reltuples > 0 else None
+
+    def _estimate_data_to_delete_mysql(self):
+        """
+        Get the rows estimated by the MySQL optimizer for the expired rows, the rows it expects from the scan of the
+        table after its condition
+        """
+
+        sql = 'EXPLAIN FORMAT=JSON SELECT {0} FROM {1} WHERE {2}'.format(
+            self._db_primary_key_name(), self._db_table_name(), self._db_condition()
+        )
+        plan = self._fetch_value(sql, self._db_params())
+        if not plan:
+            return None
+        rows = json.loads(plan).get('query_block', {}).get('table', {}).get('rows_produced_per_join')
+        return int(rows) if rows is not None else None
 
     def _get_user(self):
         """
@@ -114,52 +700,547 @@ class CleanUPTablesManager(CleanUPTableConstants, CommonUtilsMethodsMixin):
             params = {'username': settings.USERNAME_BY_DEFAULT}
         return User.objects.get(**params)
 
-    def _open_sql_file(self, sql_file):
+    def _open_sql_file(self, sql_file, sql_name=None):
         """
-        Get SQL content
+        Get SQL content. An uploaded SQL file always overrides the SQL file of the database backend dialect.
         """
 
         if sql_file:
             path = sql_file.path
         else:
-            path = os.path.join(self.file.get_base_path(__file__), self.SQL_NAME)
+            path = os.path.join(self.file.get_base_path(__file__), self.dialect.get_sql_name(sql_name or self.SQL_NAME))
 
         return self.file.get_string_from_file(path=path)
 
-    def _get_sql(self):
+    def _get_sql(self, sql_raw=None, **kwargs):
+        """
+        Generate the SQL as string mode. The values that change between tables and batches, the cleanup date, the
+        limit and the primary key bounds, are bind parameters (see `_db_params`), so every batch of the table runs the
+        same statement, which is cached for the table in execution.
+
+        Args:
+            sql_raw (string, optional): SQL template, `self.sql_raw` by default
+            kwargs: Extra placeholders used by the template
+        """
+
+        sql_raw = sql_raw or self.sql_raw
+        key = (sql_raw, tuple(sorted(kwargs.items())))
+        if key not in self._sql:
+            self._sql[key] = sql_raw.format(
+                db_table_name=self._db_table_name(),
+                db_condition=self._db_condition(),
+                limit='%(limit)s',
+                primary_key_name=self._db_primary_key_name(),
+                **kwargs
+            )
+        return self._sql[key]
+
+    def _get_archiver(self):
         """
-        Generate the SQL as string mode
+        Get the archiver of the deleted rows, None when the table doesn't archive them
         """
 
-        return self.sql_raw.format(
-            db_table_name=self._db_table_name(),
-            db_condition=self._db_condition(),
-            limit=self.LIMIT_TO_CLEAN,
-            primary_key_name=self._db_primary_key_name()
+        if not self.table.archive_format:
+            return None
+        return CleanUPArchiver(
+            table=self.table,
+            archive_format=self.table.archive_format,
+            compression=self.table.archive_compression,
+            fetch_size=self.ARCHIVE_FETCH_SIZE,
+            file_rows=self.ARCHIVE_FILE_ROWS
         )
 
     def _delete_in_bulk(self):
         """
-        Delete all the logs in bulk
+        Delete all the logs in bulk with the strategy defined for the table.
+        When the table archives its rows, each batch streams the rows it deletes to the archive files first.
         """
 
+        self.archiver = self._get_archiver()
         try:
-            sql = self._get_sql()
-            for _ in range(self.total_events):
-                self._execute_sql(sql)
-                self._manage_transaction()
+            if self.parallelism > 1 and self.strategy == KEYSET:
+                self._delete_in_slices()
+            else:
+                getattr(self, '_delete_{0}'.format(self.strategy))()
         except Exception as err:
             self._manage_transaction(transaction_type='rollback')
             self.errors = '{0}'.format(err)
+        finally:
+            if self.archiver:
+                self.archiver.close()
+
+    def _delete_in_slices(self):
+        """
+        Split the expired primary key range in `parallelism` disjoint slices and delete them at the same time, each
+        one with the keyset strategy in its own thread and database connection. The progress of every slice is kept
+        in `slices` and the rows and batches of all of them are saved in the table like the progress of a single
+        range. Primary keys that are not integers can't be split, so they are deleted in a single range.
+        """
+
+        low, high = self._fetch_row('SELECT MIN({0}), MAX({0}) FROM {1} WHERE {2}'.format(
+            self._db_primary_key_name(), self._db_table_name(), self._db_condition()
+        ), self._db_params())
+        if low is None:
+            return
+        if not isinstance(low, int):
+            self._delete_keyset()
+            return
+
+        self.slices = self._split_primary_key_range(low, high, self.parallelism)
+        self.progress_lock = threading.Lock()
+        with ThreadPoolExecutor(max_workers=len(self.slices)) as executor:
+            workers = list(executor.map(self._delete_slice, self.slices))
+
+        self.batch_size.size = sum(worker.batch_size.size for worker in workers) // len(workers)
+        self.stopped = any(worker.stopped for worker in workers)
+        self.retries += sum(worker.retries for worker in workers)
+        self.retry_seconds += sum(worker.retry_seconds for worker in workers)
+        errors = [worker.errors for worker in workers if worker.errors]
+        if errors:
+            self.errors = '\n'.join(errors)
+
+    @staticmethod
+    def _split_primary_key_range(low, high, parallelism):
+        """
+        Split the primary keys between `low` and `high` in disjoint slices.
+
+        Returns:
+            list: The slices, `low` is excluded and `high` included to be used as keyset watermark and bound.
+        """
+
+        step = -(-(high - low + 1) // parallelism)
+        slices = []
+        for slice_low in range(low - 1, high, step):
+            slices.append({
+                'low': slice_low,
+                'high': min(slice_low + step, high),
+                'logs_deleted': 0,
+                'batches_done': 0,
+                'rows_per_second': 0,
+                'completion': 0,
+                'errors': None,
+            })
+        return slices
+
+    def _delete_slice(self, _slice):
+        """
+        Delete one slice of the primary key range in a worker thread
+        """
+
+        worker = copy.copy(self)
+        worker.parent = self
+        worker.cursors = {}
+        worker.slice = _slice
+        worker.batch_size = copy.copy(self.batch_size)
+        worker.throttle = copy.copy(self.throttle)
+        worker.parallelism = 1
+        worker.logs_deleted = 0
+        worker.errors = None
+        worker.retries = 0
+        worker.retry_seconds = 0.0
+        worker.started_at = time.monotonic()
+        try:
+            worker._delete_in_bulk()
+        finally:
+            worker._close_cursors()
+            connections.close_all()
+
+        _slice['errors'] = worker.errors
+        logger.info(
+            'Slice %s-%s of %s: %s rows deleted, %s rows/s, %s%% completed',
+            _slice['low'], _slice['high'], self._db_table_name(), _slice['logs_deleted'], _slice['rows_per_second'],
+            _slice['completion']
+        )
+        return worker
+
+    def _update_slice_progress(self, watermark):
+        """
+        Update the deleted rows, throughput and completion percentage of the slice cleaned by this worker, and add
+        the rows of its last committed batch to the progress of the table
+        """
+
+        elapsed = time.monotonic() - self.started_at
+        low, high = self.slice['low'], self.slice['high']
+        if watermark is not None:
+            self.slice['batches_done'] += 1
+            self.parent._save_slice_progress(self.logs_deleted - self.slice['logs_deleted'])
+        self.slice['logs_deleted'] = self.logs_deleted
+        self.slice['rows_per_second'] = round(self.logs_deleted / elapsed, 2) if elapsed else 0
+        self.slice['completion'] = 100 if watermark is None else round((watermark - low) * 100.0 / (high - low), 2)
+
+    def _delete_legacy(self):
+        """
+        Run the ordered subquery SQL until a batch deletes fewer rows than the limit, so rows that expire or arrive
+        during the process are drained too. A batch that fails with a transient error is run again.
+        """
+
+        while True:
+            limit = self.batch_size.size
+            with self._instrument_batch(), self._batch_transaction():
+                rowcount = self._execute_sql(self._get_sql(), self._db_params(), archive=bool(self.archiver))
+            if not self.retry_batch:
+                self._save_progress()
+                if rowcount < limit:
+                    break
+            if not self._pace():
+                break
+
+    def _delete_keyset(self, delete_range=None):
+        """
+        Walk the expired rows by primary key ranges.
+
+        Each batch gets the highest primary key of the next `batch_size` expired rows above the watermark and
+        deletes the range between both keys, then the watermark moves to that key. Both statements are bounded index
+        range scans, so the batch cost doesn't grow with the expired rows left behind.
+
+        The rows of other tables that depend on each range through foreign keys are handled in the same transaction,
+        before the range is deleted. A batch that fails with a transient error, reading its bound or deleting its
+        range, is taken again.
+
+        Args:
+            delete_range (callable, optional): Method that removes the rows of one range, `_delete_range` by default
+        """
+
+        delete_range = delete_range or self._delete_range
+        if self.has_dependents:
+            delete_range = functools.partial(self._delete_range_with_dependents, delete_range=delete_range)
+        watermark = self.slice['low'] if self.slice else self.watermark
+        while True:
+            watermark_condition, params = self._db_watermark_condition(watermark)
+            upper_bound = None
+            with self._instrument_batch() as batch, self._batch_transaction():
+                upper_bound = self._fetch_value(
+                    self._get_sql(self.sql_keyset_bound_raw, watermark_condition=watermark_condition),
+                    self._db_params(**params)
+                )
+                if upper_bound is None:
+                    batch['empty'] = True
+                else:
+                    delete_range(watermark_condition, self._db_params(upper_bound=upper_bound, **params))
+            if upper_bound is None and not self.retry_batch:
+                break
+            if not self.retry_batch:
+                watermark = upper_bound
+                if self.slice:
+                    self._update_slice_progress(watermark)
+                else:
+                    self._save_progress(watermark)
+            if not self._pace():
+                break
+
+        if self.slice and not self.stopped:
+            self._update_slice_progress(None)
+
+    def _delete_range(self, watermark_condition, params):
+        """
+        Delete the rows of one keyset range, archiving them first in the same transaction when the table archives them.
+        When the backend allows it, the rows of a range that isn't archived are locked with SKIP LOCKED, so the rows
+        locked by other transactions are left for the next execution instead of waiting for them.
+        """
+
+        sql_raw = self.sql_keyset_skip_locked_raw if self.skip_locked and not self.archiver else self.sql_keyset_raw
+        delete_sql = self._get_sql(sql_raw, watermark_condition=watermark_condition)
+        if not self.archiver:
+            self._execute_sql(delete_sql, params)
+            return
+
+        with transaction.atomic(using=self.using):
+            archive_sql = self._get_sql(self.sql_keyset_archive_raw, watermark_condition=watermark_condition)
+            self._archive_rows(archive_sql, params)
+            self._execute_sql(delete_sql, params)
+
+    def _delete_move(self):
+        """
+        Move the expired rows to the archive table of the table, walking them by primary key ranges like the keyset
+        strategy
+        """
+
+        self._delete_keyset(self._move_range)
+
+    def _move_range(self, watermark_condition, params):
+        """
+        Move the rows of one keyset range to the archive table without reading them from the database.
+        PostgreSQL moves them with a single statement, a data-modifying CTE that inserts the rows returned by the
+        delete. Other backends insert and delete the range in the same transaction.
+        """
+
+        placeholders = {
+            'watermark_condition': watermark_condition,
+            'archive_table_name': self.table.archive_table,
+            'columns': self._db_column_names(),
+        }
+        if self.connection.vendor == 'postgresql':
+            self._execute_sql(self._get_sql(self.sql_move_raw, **placeholders), params)
+            return
+
+        with transaction.atomic(using=self.using):
+            self._execute_statement(self._get_sql(self.sql_move_insert_raw, **placeholders), params)
+            self._execute_sql(self._get_sql(self.sql_keyset_raw, watermark_condition=watermark_condition), params)
+
+    @contextmanager
+    def _instrument_batch(self):
+        """
+        Send the `batch_started` and `batch_finished` signals around a batch and keep its latency for the run history.
+        A batch rolled back to be retried sends no `batch_finished` and isn't kept, its retry is the batch. Neither
+        is a batch marked as `empty` in the state yielded to the caller, one that found no rows left to delete.
+        """
+
+        arguments = {
+            'manager': self,
+            'table': self.table,
+            'strategy': self.strategy,
+            'batch_size': self.batch_size.size,
+        }
+        batch_started.send(sender=self.__class__, **arguments)
+        rows = self.logs_deleted
+        started_at = time.monotonic()
+        batch = {'empty': False}
+        yield batch
+        if self.retry_batch or batch['empty']:
+            return
+        seconds = time.monotonic() - started_at
+        self.batch_latencies.append(seconds)
+        batch_finished.send(sender=self.__class__, rows=self.logs_deleted - rows, seconds=seconds, **arguments)
+
+    @contextmanager
+    def _batch_transaction(self):
+        """
+        Run a batch in a transaction with its lock and statement timeouts.
+
+        A batch that fails with a transient error, a timeout, a deadlock, a serialization failure or a lost
+        connection, is rolled back and `retry_batch` tells the caller to take its rows again after a jittered
+        exponential backoff. A timeout also shrinks the batch size and a lost connection is opened again. The table
+        fails with any other error or after `max_batch_retries` retries in a row. The retries and the time lost in
+        them are kept for the run history. The archived rows of the batch are written to the archive files only when
+        its transaction commits.
+        """
+
+        self.retry_batch = False
+        started_at = time.monotonic()
+        logs_deleted = self.logs_deleted
+        try:
+            with self._restore_session_timeouts(), transaction.atomic(using=self.using):
+                for sql in self.dialect.get_timeout_statements(self.lock_timeout, self.statement_timeout):
+                    self._execute_statement(sql)
+                yield
+        except (DatabaseError, InterfaceError) as err:
+            self.logs_deleted = logs_deleted
+            if self.archiver:
+                self.archiver.rollback()
+            connection_lost = not self._is_connection_usable()
+            if not (connection_lost or self.dialect.is_transient(err)) or self.batch_retries >= self.max_batch_retries:
+                raise
+            self.batch_retries += 1
+            self.retry_batch = True
+            if self.dialect.is_timeout(err):
+                self.batch_size.shrink()
+            if connection_lost:
+                self._reconnect()
+            backoff = self._get_backoff(self.batch_retries)
+            logger.warning(
+                'Batch of %s failed (%s), retry %s in %.2f seconds with %s rows',
+                self._db_table_name(), err, self.batch_retries, backoff, self.batch_size.size
+            )
+            time.sleep(backoff)
+            self.retries += 1
+            self.retry_seconds += time.monotonic() - started_at
+        else:
+            if self.archiver:
+                self.archiver.commit()
+            self.batch_retries = 0
 
-    def _execute_sql(self, sql):
+    @contextmanager
+    def _restore_session_timeouts(self):
         """
-        Execute SQL query to clean the tables
+        Restore the session timeouts changed by a batch once its transaction is over. Most backends set them only
+        for the transaction; MySQL sets them in the session, and the connection is reused by the application.
         """
 
-        with connection.cursor() as cursor:
-            cursor.execute(sql)
-            self.logs_deleted += cursor.rowcount
+        try:
+            yield
+        finally:
+            for sql in self.dialect.get_timeout_reset_statements(self.lock_timeout, self.statement_timeout):
+                try:
+                    self._execute_statement(sql)
+                except (DatabaseError, InterfaceError) as err:
+                    logger.warning('Timeouts of %s were not restored: %s', self._db_table_name(), err)
+
+    def _get_backoff(self, attempt):
+        """
+        Get the seconds to wait before a retry, a random time up to the exponential backoff of the attempt
+        """
+
+        return random.uniform(0, min(self.RETRY_MAX_BACKOFF_SECONDS, self.RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)))
+
+    def _is_connection_usable(self):
+        """
+        Validate if the connection of the table in execution is still open
+        """
+
+        return self.connection.connection is not None and self.connection.is_usable()
+
+    def _reconnect(self):
+        """
+        Close the lost connection of the table, the next statement opens a new one. The advisory lock of the table
+        was released with the lost session, so the process takes it again; the slices run with the lock of the
+        process.
+        """
+
+        cursor = self.cursors.pop(self.using, None)
+        try:
+            if cursor is not None:
+                cursor.close()
+        except Exception:
+            pass  # The cursor of a lost connection can't always be closed
+        self.connection.close()
+        if not self.slice and not self._try_advisory_lock(self.table):
+            raise DatabaseError('The lock of the table was taken by another process after its connection was lost.')
+
+    def _pace(self):
+        """
+        Wait after a committed batch as the throttle of the table requires
+
+        Returns:
+            bool: False when the time budget is over, the table is marked as stopped
+        """
+
+        if self.throttle.wait(self):
+            return True
+        logger.info('Time budget of %s is over after %s batches', self._db_table_name(), self.batches_done)
+        self.stopped = True
+        return False
+
+    def _save_progress(self, watermark=None):
+        """
+        Save the run state and the progress after a committed batch, so an interrupted execution can resume from it
+        and the admin shows how far it is. The first batch is saved and then at most one batch every
+        `progress_seconds`, so the writes don't load the table. An interrupted execution resumes from the last
+        watermark saved, the batches after it find their rows already deleted.
+        """
+
+        self.batches_done += 1
+        self.watermark = watermark
+        self._write_progress(watermark)
+
+    def _save_slice_progress(self, rows):
+        """
+        Add a batch committed by one of the slices to the progress of the table. The slices share the rows, batches
+        and the time of the last save, so the table is written at most once every `progress_seconds` for all of them.
+        There's no watermark to resume from, an interrupted execution takes the whole range again.
+        """
+
+        with self.progress_lock:
+            self.logs_deleted += rows
+            self.batches_done += 1
+            self._write_progress()
+
+    def _write_progress(self, watermark=None):
+        """
+        Write the progress in the table when the last write is older than `progress_seconds`
+        """
+
+        now = time.monotonic()
+        if self.progress_saved_at is not None and now - self.progress_saved_at < self.progress_seconds:
+            return
+
+        seconds = now - (self.progress_saved_at or self.started_at)
+        CleanUPTables.objects.filter(pk=self.table.pk).update(
+            logs_deleted=self.logs_deleted,
+            batches_done=self.batches_done,
+            watermark=None if watermark is None else '{0}'.format(watermark),
+            estimated_rows=self.estimated_rows,
+            current_rows_per_second=round((self.logs_deleted - self.progress_rows) / seconds, 2) if seconds else None,
+            progress_updated_at=self.get_current_date()
+        )
+        self.progress_saved_at = now
+        self.progress_rows = self.logs_deleted
+
+    def _archive_rows(self, sql, params=None):
+        """
+        Stream the rows of a query to the archive files with a server-side cursor when the backend has it
+        """
+
+        cursor = self.connection.chunked_cursor()
+        try:
+            cursor.execute(sql, params)
+            return self.archiver.write(cursor)
+        finally:
+            cursor.close()
+
+    def _execute_sql(self, sql, params=None, archive=False):
+        """
+        Execute SQL query to clean the tables, its latency resizes the next batch.
+
+        Args:
+            sql (string): Delete statement
+            params (dict, optional): Statement parameters
+            archive (bool, optional): Archive the deleted rows returned by the statement
+        """
+
+        if archive:
+            if not self.dialect.can_return_deleted_rows(self.connection):
+                raise ArchiveException(self.connection.vendor)
+            sql = '{0} RETURNING *'.format(sql.strip().rstrip(';'))
+
+        started_at = time.monotonic()
+        cursor = self._get_cursor()
+        cursor.execute(sql, params)
+        rowcount = self.archiver.write(cursor) if archive else max(cursor.rowcount, 0)
+        self.batch_size.update(rowcount, time.monotonic() - started_at)
+        self.logs_deleted += rowcount
+        return rowcount
+
+    def _get_cursor(self):
+        """
+        Get the cursor of the database where the table in execution is cleaned. Each database alias keeps one cursor
+        that runs all the statements of its tables.
+        """
+
+        if self.using not in self.cursors:
+            self.cursors[self.using] = self.connection.cursor()
+        return self.cursors[self.using]
+
+    def _close_cursors(self):
+        """
+        Close the cursors of all the databases
+        """
+
+        for cursor in self.cursors.values():
+            cursor.close()
+        self.cursors = {}
+
+    def _execute_statement(self, sql, params=None):
+        """
+        Execute a SQL statement that doesn't delete rows in batches
+        """
+
+        self._get_cursor().execute(sql, params)
+
+    def _fetch_all(self, sql, params=None):
+        """
+        Execute a SQL query and return all the rows
+        """
+
+        cursor = self._get_cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    def _fetch_row(self, sql, params=None):
+        """
+        Execute a SQL query and return the first row
+        """
+
+        cursor = self._get_cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+    def _fetch_value(self, sql, params=None):
+        """
+        Execute a SQL query and return the first column of the first row
+        """
+
+        row = self._fetch_row(sql, params)
+        return row[0] if row else None
 
     def _db_table_name(self):
         """
@@ -182,40 +1263,202 @@ class CleanUPTablesManager(CleanUPTableConstants, CommonUtilsMethodsMixin):
 
         return self.model_class._meta.pk.name
 
+    def _db_column_names(self):
+        """
+        Get the column names of the model, in the same order, to copy its rows to another table
+        """
+
+        return ', '.join(field.column for field in self.model_class._meta.concrete_fields)
+
     def _db_condition(self):
         """
-        Get WHERE condition to build the SQL
+        Get WHERE condition to build the SQL, the cleanup date is the `cutoff` bind parameter.
+        An incremental table with a previous cutoff only takes the rows expired after it, an index range that grows
+        with the rows expired since the last execution instead of with the table.
         """
 
-        condition = "{0} <= '{1}'".format(
-            self.date_field,
-            self.date_rule.strftime(self.FULL_FORMAT_DATE)[:-3]
-        )
-        return condition
+        condition = '{0} <= %(cutoff)s'.format(self.date_field)
+        if self.previous_cutoff is None:
+            return condition
+        return '{0} > %(previous_cutoff)s AND {1}'.format(self.date_field, condition)
 
-    @staticmethod
-    def _manage_transaction(transaction_type='commit'):
+    def _db_params(self, **kwargs):
         """
-        Apply commit or rollback on the current transaction
+        Get the bind parameters of the SQL generated
+
+        Args:
+            kwargs: Extra parameters used by the SQL
+        """
+
+        params = {
+            'cutoff': self.date_rule,
+            'limit': self.batch_size.size,
+        }
+        if self.previous_cutoff is not None:
+            params['previous_cutoff'] = self.previous_cutoff
+        params.update(kwargs)
+        return params
+
+    def _db_watermark_condition(self, watermark):
+        """
+        Get the WHERE condition that skips the rows below the watermark, the first batch has no watermark.
+        A slice also skips the rows above its highest primary key.
+
+        Returns:
+            tuple: The condition and its parameters
+        """
+
+        condition, params = '', {}
+        if watermark is not None:
+            condition += ' AND {0} > %(watermark)s'.format(self._db_primary_key_name())
+            params['watermark'] = watermark
+        if self.slice:
+            condition += ' AND {0} <= %(slice_high)s'.format(self._db_primary_key_name())
+            params['slice_high'] = self.slice['high']
+        return condition, params
+
+    def _manage_transaction(self, transaction_type='commit'):
+        """
+        Apply commit or rollback on the current transaction of the database where the table is cleaned
         """
 
         try:
-            getattr(transaction, transaction_type)()
+            getattr(transaction, transaction_type)(using=self.using)
         except transaction.TransactionManagementError:
             pass  # This code isn't under transaction management
 
+    def _run_maintenance(self, table):
+        """
+        Refresh the planner statistics of the table and clean its dead rows when the rows deleted are a fraction of
+        the table above its maintenance threshold, and save the time it took with the results of the execution.
+        The databases without cheap statistics of the live rows run it after every execution that deleted rows.
+        """
+
+        threshold = table.maintenance_threshold
+        if threshold is None:
+            threshold = getattr(settings, 'CLEANUP_TABLES_MAINTENANCE_THRESHOLD', None)
+        sql = self.dialect.RECLAIM_SPACE_SQL if table.reclaim_space else self.dialect.MAINTENANCE_SQL
+        if threshold is None or not sql or self.errors or not self.logs_deleted:
+            return
+
+        try:
+            live_rows = self._get_live_rows()
+            if live_rows is not None and self.logs_deleted < threshold * (self.logs_deleted + live_rows):
+                return
+            started_at = time.monotonic()
+            self._execute_statement(sql.format(db_table_name=self._db_table_name()))
+        except Exception as err:
+            self._manage_transaction(transaction_type='rollback')
+            logger.warning('Maintenance of table %s failed: %s', table.table_name, err)
+            return
+
+        maintenance_seconds = round(time.monotonic() - started_at, 3)
+        logger.info('Maintenance of table %s took %s seconds', table.table_name, maintenance_seconds)
+        table.maintenance_seconds = maintenance_seconds
+        CleanUPTables.objects.filter(pk=table.pk).update(maintenance_seconds=maintenance_seconds)
+        CleanUPRun.objects.filter(pk=self.run.pk).update(maintenance_seconds=maintenance_seconds)
+
+    def _get_live_rows(self):
+        """
+        Get the rows left in the table from the database statistics, the table is never counted
+
+        Returns:
+            int: The rows estimated, None when the database backend has no cheap estimate.
+        """
+
+        live_rows = getattr(self, '_get_live_rows_{0}'.format(self.connection.vendor), None)
+        return live_rows() if live_rows else None
+
+    def _get_live_rows_postgresql(self):
+        """
+        Get the live rows of the table counted by the PostgreSQL statistics collector
+        """
+
+        return self._fetch_value(
+            'SELECT n_live_tup FROM pg_stat_user_tables WHERE relid = %s::regclass', [self._db_table_name()]
+        ) or 0
+
+    def _get_live_rows_mysql(self):
+        """
+        Get the rows of the table estimated by the MySQL statistics
+        """
+
+        sql = 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s'
+        return int(self._fetch_value(sql, [self._db_table_name()]) or 0)
+
+    def _update_history(self, table):
+        """
+        Update the throughput and backlog growth of the table used by the scheduler, as moving averages of its
+        executions. A drained table leaves no backlog, the backlog left by a table stopped by its time budget is taken
+        from the rows estimate. Failed executions don't change the history.
+        """
+
+        if self.errors:
+            return
+
+        seconds = time.monotonic() - self.started_at
+        if self.logs_deleted and seconds > 0:
+            table.rows_per_second = self._get_moving_average(table.rows_per_second, self.logs_deleted / seconds)
+
+        backlog_rows = 0
+        if self.stopped:
+            backlog_rows = max(self.estimated_rows - self.logs_deleted, 0) if self.estimated_rows else None
+        elapsed = CleanUPScheduler.seconds_since(table.last_executed)
+        if backlog_rows is not None and table.backlog_rows is not None and elapsed > 0:
+            growth = max(self.logs_deleted + backlog_rows - table.backlog_rows, 0) / elapsed
+            table.backlog_growth = self._get_moving_average(table.backlog_growth, growth)
+        table.backlog_rows = backlog_rows
+
+    def _get_moving_average(self, average, value):
+        """
+        Get the exponential moving average after a new value, the value itself when there is no average yet
+        """
+
+        if average is None:
+            return value
+        return average + self.HISTORY_WEIGHT * (value - average)
+
     def _finish_instance(self, table, status=SUCCESS):
         """
         Update the table log instance with the process result.
+        An incremental table keeps the cutoff of the executions finished without errors, the next one starts there.
+        A resumed execution skips the rows below its watermark that expired after it was interrupted, so it keeps the
+        previous cutoff and the next execution takes the whole window again.
         """
 
         if self.errors:
             status = ERROR
+        elif self.stopped:
+            status = PARTIAL
 
+        self._update_history(table)
         table.status = status
         table.errors = self.errors
+        table.deferred_reason = None
         table.logs_deleted = self.logs_deleted
+        table.batches_done = self.batches_done
+        table.watermark = None
+        table.batch_size = self.batch_size.size
+        table.estimated_rows = self.estimated_rows
+        if table.incremental and status == SUCCESS and not self.resumed:
+            table.last_cutoff = timezone.make_aware(self.date_rule) if settings.USE_TZ else self.date_rule
         table.total_logs_deleted += self.logs_deleted
         table.last_executed = self.get_current_date()
         table.updated_by = self.user
         table.save()
+        self._finish_run(table)
+
+    def _finish_run(self, table):
+        """
+        Save the result of the execution in the run history, the rows deleted by a resumed execution don't include
+        the ones deleted before it was interrupted
+        """
+
+        self.run.status = table.status
+        self.run.errors = self.errors
+        self.run.finished_at = table.last_executed
+        self.run.rows_deleted = self.logs_deleted - self.run_rows
+        self.run.retries = self.retries
+        self.run.retry_seconds = round(self.retry_seconds, 3)
+        self.run.set_batch_latencies(self.batch_latencies)
+        self.run.save()
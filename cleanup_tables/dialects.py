@@ -0,0 +1,235 @@
+import math
+import zlib
+
+from cleanup_tables.constants import CleanUPTableConstants
+
+
+class BaseDialect(object):
+    """
+    Class to manage the SQL used by a database backend, identified by its `connection.vendor`.
+    The backends without a dialect use the default SQL files.
+    """
+
+    vendor = None
+    SQL_NAMES = {}
+    LOCK_SQL = None
+    UNLOCK_SQL = None
+    CREATE_INDEX_SQL = 'CREATE INDEX {index_name} ON {db_table_name} ({columns})'
+    DROP_INDEX_SQL = 'DROP INDEX {index_name}'
+    INDEX_PROGRESS_SQL = None
+    MAINTENANCE_SQL = None
+    RECLAIM_SPACE_SQL = None
+    SKIP_LOCKED = False
+    LOCK_TIMEOUT_SQL = None
+    STATEMENT_TIMEOUT_SQL = None
+    LOCK_TIMEOUT_RESET_SQL = None
+    STATEMENT_TIMEOUT_RESET_SQL = None
+    TIMEOUT_ERROR_CODES = ()
+    TRANSIENT_ERROR_CODES = ()
+    DELETE_RETURNING = False
+
+    def get_sql_name(self, sql_name):
+        """
+        Get the SQL file of the backend that replaces the default `sql_name` file
+        """
+
+        return self.SQL_NAMES.get(sql_name, sql_name)
+
+    def get_lock_key(self, lock_name):
+        """
+        Get the key of the advisory lock used by the `LOCK_SQL` and `UNLOCK_SQL` of the backend.
+        The backends without `LOCK_SQL` have no advisory locks.
+        """
+
+        return lock_name
+
+    def get_timeout_statements(self, lock_timeout, statement_timeout):
+        """
+        Get the statements that set the lock and statement timeouts of a batch, given in seconds. The backends
+        without `LOCK_TIMEOUT_SQL` or `STATEMENT_TIMEOUT_SQL` keep their own timeouts.
+        """
+
+        statements = []
+        for sql, seconds in ((self.LOCK_TIMEOUT_SQL, lock_timeout), (self.STATEMENT_TIMEOUT_SQL, statement_timeout)):
+            if sql and seconds:
+                statements.append(sql.format(
+                    milliseconds=int(seconds * 1000), seconds=max(int(math.ceil(seconds)), 1)
+                ))
+        return statements
+
+    def get_timeout_reset_statements(self, lock_timeout, statement_timeout):
+        """
+        Get the statements that restore the timeouts set by `get_timeout_statements` once the transaction of the
+        batch is over. Only the backends whose timeouts outlive the transaction have `LOCK_TIMEOUT_RESET_SQL` or
+        `STATEMENT_TIMEOUT_RESET_SQL`.
+        """
+
+        statements = []
+        for sql, reset_sql, seconds in ((self.LOCK_TIMEOUT_SQL, self.LOCK_TIMEOUT_RESET_SQL, lock_timeout),
+                                        (self.STATEMENT_TIMEOUT_SQL, self.STATEMENT_TIMEOUT_RESET_SQL,
+                                         statement_timeout)):
+            if sql and reset_sql and seconds:
+                statements.append(reset_sql)
+        return statements
+
+    def get_error_code(self, err):
+        """
+        Get the code of a database error, None when the backend doesn't report it
+        """
+
+        return None
+
+    def can_return_deleted_rows(self, connection):
+        """
+        Validate if the backend returns the rows removed by a DELETE with `RETURNING`, which the legacy strategy
+        needs to archive them
+        """
+
+        return self.DELETE_RETURNING
+
+    def is_timeout(self, err):
+        """
+        Validate if a database error was raised by a lock or statement timeout
+        """
+
+        return self.get_error_code(err) in self.TIMEOUT_ERROR_CODES
+
+    def is_transient(self, err):
+        """
+        Validate if a database error can go away by running the statement again: timeouts, deadlocks, serialization
+        failures and lost connections
+        """
+
+        return self.is_timeout(err) or self.get_error_code(err) in self.TRANSIENT_ERROR_CODES
+
+
+class PostgreSQLDialect(BaseDialect):
+    """
+    PostgreSQL deletes each batch by its physical row ids (ctid), a TID scan with no sort or second index lookup
+    """
+
+    vendor = 'postgresql'
+    SQL_NAMES = {
+        CleanUPTableConstants.SQL_NAME: 'sql/postgresql/cleanup_process.sql',
+    }
+    LOCK_SQL = 'SELECT pg_try_advisory_lock(%s)'
+    UNLOCK_SQL = 'SELECT pg_advisory_unlock(%s)'
+    CREATE_INDEX_SQL = 'CREATE INDEX CONCURRENTLY {index_name} ON {db_table_name} ({columns})'
+    DROP_INDEX_SQL = 'DROP INDEX CONCURRENTLY IF EXISTS {index_name}'
+    INDEX_PROGRESS_SQL = 'SELECT blocks_done, blocks_total FROM pg_stat_progress_create_index ' \
+                         'WHERE relid = %(db_table_name)s::regclass'
+    MAINTENANCE_SQL = 'VACUUM (ANALYZE) {db_table_name}'
+    RECLAIM_SPACE_SQL = 'VACUUM (ANALYZE) {db_table_name}'
+    SKIP_LOCKED = True
+    LOCK_TIMEOUT_SQL = 'SET LOCAL lock_timeout = {milliseconds}'
+    STATEMENT_TIMEOUT_SQL = 'SET LOCAL statement_timeout = {milliseconds}'
+    TIMEOUT_ERROR_CODES = ('55P03', '57014')  # lock_not_available, query_canceled
+    # serialization_failure, deadlock_detected, connection_exception, connection_failure, admin_shutdown
+    TRANSIENT_ERROR_CODES = ('40001', '40P01', '08000', '08006', '57P01')
+    DELETE_RETURNING = True
+
+    def get_lock_key(self, lock_name):
+        """
+        PostgreSQL advisory locks are identified by a bigint
+        """
+
+        return zlib.crc32(lock_name.encode('utf-8'))
+
+    def get_error_code(self, err):
+        """
+        PostgreSQL reports the SQLSTATE of the error, `pgcode` in psycopg2 and `sqlstate` in psycopg 3
+        """
+
+        cause = err.__cause__ or err
+        return getattr(cause, 'pgcode', None) or getattr(cause, 'sqlstate', None)
+
+
+class MySQLDialect(BaseDialect):
+    """
+    MySQL can't select from the table it deletes in a subquery, it deletes each batch with ORDER BY and LIMIT
+    """
+
+    vendor = 'mysql'
+    SQL_NAMES = {
+        CleanUPTableConstants.SQL_NAME: 'sql/mysql/cleanup_process.sql',
+        CleanUPTableConstants.SQL_KEYSET_BOUND_NAME: 'sql/mysql/cleanup_keyset_bound.sql',
+    }
+    LOCK_SQL = 'SELECT GET_LOCK(%s, 0)'
+    UNLOCK_SQL = 'SELECT RELEASE_LOCK(%s)'
+    CREATE_INDEX_SQL = 'CREATE INDEX {index_name} ON {db_table_name} ({columns}) ALGORITHM=INPLACE LOCK=NONE'
+    DROP_INDEX_SQL = 'DROP INDEX {index_name} ON {db_table_name}'
+    INDEX_PROGRESS_SQL = "SELECT WORK_COMPLETED, WORK_ESTIMATED FROM performance_schema.events_stages_current " \
+                         "WHERE EVENT_NAME LIKE 'stage/innodb/alter%%'"
+    MAINTENANCE_SQL = 'ANALYZE TABLE {db_table_name}'
+    RECLAIM_SPACE_SQL = 'OPTIMIZE TABLE {db_table_name}'
+    # MySQL has no timeouts of the transaction, the one of the session is kept to restore it after the batch
+    LOCK_TIMEOUT_SQL = 'SET @cleanup_tables_lock_wait_timeout = @@SESSION.innodb_lock_wait_timeout, ' \
+                       'SESSION innodb_lock_wait_timeout = {seconds}'
+    LOCK_TIMEOUT_RESET_SQL = 'SET SESSION innodb_lock_wait_timeout = @cleanup_tables_lock_wait_timeout'
+    TIMEOUT_ERROR_CODES = (1205, 3024)  # ER_LOCK_WAIT_TIMEOUT, ER_QUERY_TIMEOUT
+    TRANSIENT_ERROR_CODES = (1213, 2006, 2013)  # ER_LOCK_DEADLOCK, CR_SERVER_GONE_ERROR, CR_SERVER_LOST
+
+    def get_lock_key(self, lock_name):
+        """
+        MySQL lock names are limited to 64 characters
+        """
+
+        return lock_name[:64]
+
+    def get_error_code(self, err):
+        """
+        MySQL reports the error number as the first argument of the error
+        """
+
+        args = getattr(err.__cause__ or err, 'args', ())
+        return args[0] if args else None
+
+    def can_return_deleted_rows(self, connection):
+        """
+        MariaDB returns the deleted rows since 10.5, MySQL doesn't
+        """
+
+        return connection.mysql_is_mariadb and connection.mysql_version >= (10, 5)
+
+
+class SQLiteDialect(BaseDialect):
+    """
+    SQLite deletes each batch by rowid, its clustered key, instead of the ordered subquery
+    """
+
+    vendor = 'sqlite'
+    SQL_NAMES = {
+        CleanUPTableConstants.SQL_NAME: 'sql/sqlite/cleanup_process.sql',
+        CleanUPTableConstants.SQL_KEYSET_BOUND_NAME: 'sql/sqlite/cleanup_keyset_bound.sql',
+    }
+    MAINTENANCE_SQL = 'ANALYZE {db_table_name}'
+    RECLAIM_SPACE_SQL = 'VACUUM'
+    TIMEOUT_ERROR_CODES = ('SQLITE_BUSY',)
+
+    def get_error_code(self, err):
+        """
+        SQLite reports the name of the result code since Python 3.11
+        """
+
+        return getattr(err.__cause__ or err, 'sqlite_errorname', None)
+
+    def can_return_deleted_rows(self, connection):
+        """
+        SQLite returns the deleted rows since 3.35
+        """
+
+        return connection.Database.sqlite_version_info >= (3, 35)
+
+
+DIALECTS = {dialect.vendor: dialect for dialect in (PostgreSQLDialect, MySQLDialect, SQLiteDialect)}
+
+
+def get_dialect(vendor):
+    """
+    Get the dialect of a database backend
+
+    Args:
+        vendor (string): The `connection.vendor` of the backend
+    """
+
+    return DIALECTS.get(vendor, BaseDialect)()
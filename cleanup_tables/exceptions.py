@@ -35,3 +35,34 @@ class DateFieldTypeException(Exception):
     def __unicode__(self):
         message = 'Field name "{0}" is not of the date type.'.format(self.field_name)
         return message
+
+
+class CascadeException(Exception):
+    """
+    Exception to manage the error when the rows that depend on the table through a foreign key can't be handled in SQL.
+    """
+
+    def __init__(self, foreign_key, reason):
+        self.foreign_key = foreign_key
+        self.reason = reason
+        super(CascadeException, self).__init__(self.__unicode__())
+
+    def __unicode__(self):
+        message = 'Foreign key "{0}" {1}.'.format(self.foreign_key, self.reason)
+        return message
+
+
+class ArchiveException(Exception):
+    """
+    Exception to manage the error when the database does not return the rows deleted by the `sql_file` to archive them.
+    """
+
+    def __init__(self, vendor):
+        self.vendor = vendor
+        super(ArchiveException, self).__init__(self.__unicode__())
+
+    def __unicode__(self):
+        message = 'Database "{0}" does not return the deleted rows, the rows of a SQL file can\'t be archived.'.format(
+            self.vendor
+        )
+        return message
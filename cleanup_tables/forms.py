@@ -1,12 +1,22 @@
 import os
+import re
 
 from django import forms
 from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connections, router
 
-from cleanup_tables.choices import CLEAN_UP_PERIOD_TIME_OPTIONS
+from cleanup_tables.cascade import CleanUPCascadeMixin
+from cleanup_tables.choices import CLEAN_UP_PERIOD_TIME_OPTIONS, MOVE
+from cleanup_tables.dialects import get_dialect
+from cleanup_tables.exceptions import CascadeException
 from cleanup_tables.models import CleanUPTables, ModelDoesNotExist
 
 
+# The bind parameters and the escaped percent sign, any other percent sign breaks the statement of the file
+SQL_PERCENT_SEQUENCES = re.compile(r'%%|%\(\w+\)s')
+
+
 class CleanUPTablesForm(forms.ModelForm):
     """
     Form to handle the Clean-UP table logs registration process
@@ -16,7 +26,12 @@ class CleanUPTablesForm(forms.ModelForm):
 
     class Meta:
         model = CleanUPTables
-        fields = ('table_name', 'date_field', 'clean_up_rule', 'sql_file', 'priority', 'active')
+        fields = (
+            'table_name', 'date_field', 'clean_up_rule', 'sql_file', 'priority', 'strategy', 'partition_action',
+            'swap_threshold', 'archive_format', 'archive_compression', 'archive_table', 'parallelism',
+            'min_batch_size', 'max_batch_size', 'target_batch_seconds', 'duty_cycle', 'time_budget', 'cadence',
+            'maintenance_threshold', 'reclaim_space', 'auto_index', 'incremental', 'active'
+        )
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
@@ -25,6 +40,7 @@ class CleanUPTablesForm(forms.ModelForm):
         self.sql_extensions = ['.sql']
         self.fields['table_name'].choices = [('', '-------')] + choices
         self.model = None
+        self.warnings = []
 
     def clean_table_name(self):
         try:
@@ -45,6 +61,8 @@ class CleanUPTablesForm(forms.ModelForm):
             raise forms.ValidationError(
                 'Field {0} is not date time type.'.format(date_field)
             )
+
+        self.warnings = CleanUPTables.get_index_warnings(self.model, date_field)
         return date_field
 
     def clean_clean_up_rule(self):
@@ -64,8 +82,40 @@ class CleanUPTablesForm(forms.ModelForm):
                 raise forms.ValidationError(
                     'The file uploaded has no extension .sql'
                 )
+        if isinstance(sql_file, UploadedFile):
+            content = sql_file.read().decode('utf-8', 'replace')
+            sql_file.seek(0)
+            if '%' in SQL_PERCENT_SEQUENCES.sub('', content):
+                raise forms.ValidationError(
+                    'The file uploaded has a literal % that must be written as %%'
+                )
         return sql_file
 
+    def clean(self):
+        cleaned_data = super(CleanUPTablesForm, self).clean()
+        if cleaned_data.get('strategy') == MOVE and not cleaned_data.get('archive_table'):
+            self.add_error('archive_table', 'The archive table is required by the move strategy.')
+        if cleaned_data.get('sql_file') and cleaned_data.get('archive_format') and self.model:
+            connection = connections[router.db_for_write(self.model)]
+            if not get_dialect(connection.vendor).can_return_deleted_rows(connection):
+                self.add_error('archive_format', 'The {0} database does not return the rows deleted by a SQL file, '
+                                                 'they can\'t be archived.'.format(connection.vendor))
+        if not cleaned_data.get('sql_file') and self.model:
+            try:
+                CleanUPCascadeMixin.validate_dependents(self.model)
+            except CascadeException as err:
+                self.add_error('table_name', err.__unicode__())
+        maintenance_threshold = cleaned_data.get('maintenance_threshold')
+        if maintenance_threshold is not None and not 0 <= maintenance_threshold <= 1:
+            self.add_error('maintenance_threshold', 'The maintenance threshold must be between 0 and 1.')
+        parallelism = cleaned_data.get('parallelism')
+        if parallelism is not None and parallelism < 1:
+            self.add_error('parallelism', 'The parallelism must be at least 1.')
+        duty_cycle = cleaned_data.get('duty_cycle')
+        if duty_cycle is not None and not 0 < duty_cycle <= 1:
+            self.add_error('duty_cycle', 'The duty cycle must be greater than 0 and not greater than 1.')
+        return cleaned_data
+
     def save(self, commit=False):
         instance = super(CleanUPTablesForm, self).save(commit)
         instance.created_by = self.user
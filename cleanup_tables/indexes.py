@@ -0,0 +1,175 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.db import connections
+
+from cleanup_tables.choices import ERROR, INDEX_BUILDING, INDEX_FAILED, INDEX_VALID
+from cleanup_tables.models import CleanUPTables
+
+logger = logging.getLogger(__name__)
+
+
+class CleanUPIndexMixin(object):
+    """
+    Class to build the index on the `date_field` and the primary key of the tables with `auto_index`, without
+    blocking the writes on the table when the database allows it. The index is built by the `build_index` task, the
+    cleanup of the table is held until the index is valid, so its batches never scan the whole table.
+    """
+
+    INDEX_SUFFIX = '_cleanup'
+
+    def _ensure_index(self, table):
+        """
+        Build the index of the table when it is missing
+
+        Returns:
+            bool: True when the table can be cleaned, the table doesn't build its index or the index is valid
+        """
+
+        if self._has_valid_index(table):
+            return True
+
+        index_name = self._get_covering_index()
+        if index_name:
+            self._execute_statement(self.dialect.DROP_INDEX_SQL.format(
+                index_name=index_name, db_table_name=self._db_table_name()
+            ))
+        self._build_index(table)
+        return table.index_status == INDEX_VALID
+
+    def _has_valid_index(self, table):
+        """
+        Validate if the table can be cleaned without building its index
+
+        Returns:
+            bool: True when the table doesn't build its index or the index is valid
+        """
+
+        if not table.auto_index:
+            return True
+
+        index_name = self._get_covering_index()
+        if not index_name or not self._is_valid_index(index_name):
+            return False
+        if table.index_status != INDEX_VALID:
+            self._save_index_status(table, index_status=INDEX_VALID, index_progress=100)
+        return True
+
+    def _is_index_building(self, table):
+        """
+        Validate if the index of the table is being built by a live task. The task saves its progress every
+        `progress_seconds`, a build without progress for `stale_seconds` was interrupted with its process and must
+        be enqueued again.
+        """
+
+        if table.index_status != INDEX_BUILDING:
+            return False
+        stale_at = self.get_current_date() - timedelta(seconds=self.stale_seconds)
+        return CleanUPTables.objects.filter(
+            pk=table.pk, index_status=INDEX_BUILDING, index_updated_at__gte=stale_at
+        ).exists()
+
+    def _get_covering_index(self):
+        """
+        Get the name of an index of the table that starts with the `date_field` and the primary key
+        """
+
+        columns = [self.model_class._meta.get_field(self.date_field).column, self.model_class._meta.pk.column]
+        constraints = self.connection.introspection.get_constraints(self._get_cursor(), self._db_table_name())
+        for name, constraint in constraints.items():
+            if constraint['index'] and constraint['columns'][:2] == columns:
+                return name
+        return None
+
+    def _is_valid_index(self, index_name):
+        """
+        Validate if the index can be used. PostgreSQL keeps the indexes whose concurrent build failed as invalid.
+        """
+
+        if self.connection.vendor != 'postgresql':
+            return True
+        return bool(self._fetch_value(
+            'SELECT indisvalid FROM pg_index WHERE indexrelid = %s::regclass', [index_name]
+        ))
+
+    def _build_index(self, table):
+        """
+        Create the index in a thread with its own connection and save the progress reported by the database while
+        it is built
+        """
+
+        sql = self.dialect.CREATE_INDEX_SQL.format(
+            index_name=self._get_index_name(),
+            db_table_name=self._db_table_name(),
+            columns=', '.join([
+                self.model_class._meta.get_field(self.date_field).column, self.model_class._meta.pk.column
+            ])
+        )
+        logger.info('Building the index of table %s: %s', table.table_name, sql)
+        self._save_index_status(
+            table, index_status=INDEX_BUILDING, index_progress=0, index_updated_at=self.get_current_date()
+        )
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self._create_index, sql)
+            while wait([future], timeout=self.progress_seconds).not_done:
+                self._save_index_status(
+                    table, index_progress=self._get_index_progress(), index_updated_at=self.get_current_date()
+                )
+
+        try:
+            future.result()
+        except Exception as err:
+            logger.warning('Index of table %s failed: %s', table.table_name, err)
+            self._save_index_status(
+                table, index_status=INDEX_FAILED, status=ERROR, errors='The index build failed: {0}'.format(err)
+            )
+            return
+        self._save_index_status(table, index_status=INDEX_VALID, index_progress=100)
+
+    def _create_index(self, sql):
+        """
+        Run the statement that creates the index, it is called in its own thread
+        """
+
+        connection = connections[self.using]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+        finally:
+            connection.close()
+
+    def _get_index_progress(self):
+        """
+        Get the percentage of the index built, None when the database doesn't report it
+        """
+
+        if not self.dialect.INDEX_PROGRESS_SQL:
+            return None
+        try:
+            row = self._fetch_row(self.dialect.INDEX_PROGRESS_SQL, {'db_table_name': self._db_table_name()})
+        except Exception:
+            self._manage_transaction(transaction_type='rollback')
+            return None
+        if not row or not row[1]:
+            return None
+        return round(row[0] * 100.0 / row[1], 2)
+
+    def _get_index_name(self):
+        """
+        Get the name of the index, it fits in the identifiers length of the database
+        """
+
+        name = '{0}_{1}'.format(self._db_table_name(), self.model_class._meta.get_field(self.date_field).column)
+        max_length = self.connection.ops.max_name_length() or 64
+        return '{0}{1}'.format(name[:max_length - len(self.INDEX_SUFFIX)], self.INDEX_SUFFIX)
+
+    @staticmethod
+    def _save_index_status(table, **fields):
+        """
+        Save the index fields of the table
+        """
+
+        for field, value in fields.items():
+            setattr(table, field, value)
+        CleanUPTables.objects.filter(pk=table.pk).update(**fields)
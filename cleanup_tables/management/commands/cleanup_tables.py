@@ -0,0 +1,87 @@
+import argparse
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from cleanup_tables.choices import CLEAN_UP_PRIORITY_OPTIONS
+from cleanup_tables.core import CleanUPTablesManager
+
+
+def positive_int(value):
+    """
+    Parse an option that must be an integer of at least 1
+    """
+
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('{0} must be at least 1.'.format(value))
+    return number
+
+
+class Command(BaseCommand):
+    """
+    Command to clean the tables once or as a daemon. Each table is cleaned when its cadence passed since its last
+    execution, and its advisory lock keeps other nodes from cleaning it at the same time.
+    """
+
+    help = 'Clean the tables registered in the CleanUPTables model whose cadence passed since their last execution.'
+
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self.stopping = threading.Event()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--daemon', action='store_true', help='Keep running and check the tables every interval.')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between checks in daemon mode.')
+        parser.add_argument('--force', action='store_true', help='Clean the tables even if their cadence did not pass.')
+        parser.add_argument('--table', type=int, help='ID of the only CleanUPTables instance to clean.')
+        parser.add_argument('--priority', choices=[priority for priority, _ in CLEAN_UP_PRIORITY_OPTIONS])
+        parser.add_argument('--max-workers', type=positive_int, help='Tables cleaned at the same time.')
+        parser.add_argument('--window', type=int, help='Seconds of the maintenance window of each check.')
+
+    def handle(self, *args, **options):
+        if options['daemon']:
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGINT, self._stop)
+
+        while True:
+            try:
+                self._cleanup(options)
+            except Exception as err:
+                if not options['daemon']:
+                    raise
+                self.stderr.write('The cleanup failed, it runs again in the next check: {0}'.format(err))
+            if not options['daemon'] or self.stopping.wait(options['interval']):
+                break
+
+    def _cleanup(self, options):
+        """
+        Clean the tables that are due and report their results
+        """
+
+        close_old_connections()
+        manager = CleanUPTablesManager(
+            instance_id=options['table'],
+            priority=options['priority'],
+            max_workers=options['max_workers'],
+            window=options['window'],
+            only_due=not options['force']
+        )
+        manager.cleanup()
+        for table_name, result in manager.results.items():
+            self.stdout.write('{0}: {1}, {2} rows deleted{3}'.format(
+                table_name, result['status'], result['logs_deleted'],
+                ' ({0})'.format(result['errors']) if result['errors'] else ''
+            ))
+        for table_name, reason in manager.deferred.items():
+            self.stdout.write('{0}: deferred, {1}'.format(table_name, reason))
+
+    def _stop(self, signum, frame):
+        """
+        Stop the daemon after the tables in execution
+        """
+
+        self.stdout.write('Stopping after the tables in execution.')
+        self.stopping.set()
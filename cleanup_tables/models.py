@@ -1,18 +1,25 @@
 import os
+import math
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import FieldDoesNotExist
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, connections, models, router
 from django.template.defaultfilters import slugify
+from django.utils import timezone
 
 from cleanup_tables.choices import (
     CLEAN_UP_PERIOD_TIME_OPTIONS, HOUR, DAY, WEEK, MONTH, YEAR,
-    CLEAN_UP_STATUS_OPTIONS, NEW,
-    CLEAN_UP_PRIORITY_OPTIONS, NORMAL
+    CLEAN_UP_STATUS_OPTIONS, NEW, CLEANING,
+    CLEAN_UP_PRIORITY_OPTIONS, NORMAL,
+    CLEAN_UP_STRATEGY_OPTIONS, KEYSET,
+    CLEAN_UP_PARTITION_ACTION_OPTIONS, DROP,
+    CLEAN_UP_ARCHIVE_FORMAT_OPTIONS, CLEAN_UP_ARCHIVE_COMPRESSION_OPTIONS, GZIP,
+    CLEAN_UP_INDEX_STATUS_OPTIONS
 )
-from cleanup_tables.constants import CleanUPTableHelpTextModel
+from cleanup_tables.constants import CleanUPTableConstants, CleanUPTableHelpTextModel
 from cleanup_tables.exceptions import ModelDoesNotExist, DateFormatException
 
 
@@ -42,6 +49,78 @@ class CleanUPTables(models.Model):
         default=NORMAL,
         help_text=CleanUPTableHelpTextModel.PRIORITY
     )
+    strategy = models.CharField(
+        max_length=100,
+        choices=CLEAN_UP_STRATEGY_OPTIONS,
+        default=KEYSET,
+        help_text=CleanUPTableHelpTextModel.STRATEGY
+    )
+    partition_action = models.CharField(
+        max_length=100,
+        choices=CLEAN_UP_PARTITION_ACTION_OPTIONS,
+        default=DROP,
+        help_text=CleanUPTableHelpTextModel.PARTITION_ACTION
+    )
+    archive_format = models.CharField(
+        max_length=100,
+        choices=CLEAN_UP_ARCHIVE_FORMAT_OPTIONS,
+        null=True,
+        blank=True,
+        help_text=CleanUPTableHelpTextModel.ARCHIVE_FORMAT
+    )
+    archive_compression = models.CharField(
+        max_length=100,
+        choices=CLEAN_UP_ARCHIVE_COMPRESSION_OPTIONS,
+        default=GZIP,
+        help_text=CleanUPTableHelpTextModel.ARCHIVE_COMPRESSION
+    )
+    archive_table = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        help_text=CleanUPTableHelpTextModel.ARCHIVE_TABLE
+    )
+    swap_threshold = models.FloatField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.SWAP_THRESHOLD)
+    batch_size = models.PositiveIntegerField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.BATCH_SIZE)
+    min_batch_size = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text=CleanUPTableHelpTextModel.MIN_BATCH_SIZE
+    )
+    max_batch_size = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text=CleanUPTableHelpTextModel.MAX_BATCH_SIZE
+    )
+    target_batch_seconds = models.FloatField(
+        null=True,
+        blank=True,
+        help_text=CleanUPTableHelpTextModel.TARGET_BATCH_SECONDS
+    )
+    parallelism = models.PositiveSmallIntegerField(default=1, help_text=CleanUPTableHelpTextModel.PARALLELISM)
+    duty_cycle = models.FloatField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.DUTY_CYCLE)
+    time_budget = models.PositiveIntegerField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.TIME_BUDGET)
+    cadence = models.PositiveIntegerField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.CADENCE)
+    maintenance_threshold = models.FloatField(
+        null=True,
+        blank=True,
+        help_text=CleanUPTableHelpTextModel.MAINTENANCE_THRESHOLD
+    )
+    reclaim_space = models.BooleanField(default=False, help_text=CleanUPTableHelpTextModel.RECLAIM_SPACE)
+    auto_index = models.BooleanField(default=False, help_text=CleanUPTableHelpTextModel.AUTO_INDEX)
+    incremental = models.BooleanField(default=False, help_text=CleanUPTableHelpTextModel.INCREMENTAL)
+    last_cutoff = models.DateTimeField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.LAST_CUTOFF)
+    index_status = models.CharField(
+        max_length=100,
+        choices=CLEAN_UP_INDEX_STATUS_OPTIONS,
+        null=True,
+        blank=True,
+        help_text=CleanUPTableHelpTextModel.INDEX_STATUS
+    )
+    index_progress = models.FloatField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.INDEX_PROGRESS)
+    index_updated_at = models.DateTimeField(
+        null=True, blank=True, help_text=CleanUPTableHelpTextModel.INDEX_UPDATED_AT
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey('auth.User', related_name='clean_up_created_by', null=True, blank=True,
                                    on_delete=models.SET_NULL)
@@ -52,6 +131,24 @@ class CleanUPTables(models.Model):
     status = models.CharField(max_length=100, choices=CLEAN_UP_STATUS_OPTIONS, default=NEW)
     logs_deleted = models.BigIntegerField(default=0)
     total_logs_deleted = models.BigIntegerField(default=0)
+    batches_done = models.PositiveIntegerField(default=0)
+    watermark = models.CharField(max_length=255, null=True, blank=True)
+    estimated_rows = models.BigIntegerField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.ESTIMATED_ROWS)
+    current_rows_per_second = models.FloatField(
+        null=True,
+        blank=True,
+        help_text=CleanUPTableHelpTextModel.CURRENT_ROWS_PER_SECOND
+    )
+    progress_updated_at = models.DateTimeField(null=True, blank=True)
+    rows_per_second = models.FloatField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.ROWS_PER_SECOND)
+    backlog_rows = models.BigIntegerField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.BACKLOG_ROWS)
+    backlog_growth = models.FloatField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.BACKLOG_GROWTH)
+    maintenance_seconds = models.FloatField(
+        null=True,
+        blank=True,
+        help_text=CleanUPTableHelpTextModel.MAINTENANCE_SECONDS
+    )
+    deferred_reason = models.TextField(null=True, blank=True, help_text=CleanUPTableHelpTextModel.DEFERRED_REASON)
     errors = models.TextField(blank=True, null=True)
     active = models.BooleanField(default=True)
 
@@ -102,6 +199,42 @@ class CleanUPTables(models.Model):
 
         return model._meta.get_field(field_name).__class__ in [models.DateTimeField, models.DateField]
 
+    @classmethod
+    def get_index_warnings(cls, model, field_name):
+        """
+        Validate that the indexes of the database table let the batches find the expired rows without scanning it.
+        The date field needs an index that starts with it, and the keyset strategies walk the primary key.
+
+        Args:
+            model (ModelBase): model Class to validate
+            field_name (String): date field of the cleanup
+
+        Returns:
+            list: The warnings, empty when the indexes are usable or the table can't be inspected
+        """
+
+        connection = connections[router.db_for_write(model) or DEFAULT_DB_ALIAS]
+        column = model._meta.get_field(field_name).column
+        try:
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table).values()
+        except Exception:
+            return []
+
+        warnings = []
+        indexes = [constraint['columns'] for constraint in constraints if constraint['index']]
+        if not any(columns and columns[0] == column for columns in indexes):
+            if any(column in columns for columns in indexes):
+                warnings.append('The indexes with {0} do not start with it, the batches can not use them to find '
+                                'the expired rows.'.format(column))
+            else:
+                warnings.append('There is no index on {0}, every batch scans the whole table to find the expired '
+                                'rows.'.format(column))
+        if not any(constraint['primary_key'] for constraint in constraints):
+            warnings.append('There is no primary key index on {0}, the keyset batches scan the whole '
+                            'table.'.format(model._meta.db_table))
+        return warnings
+
     def get_date(self):
         """
         Build date from the `clean_up_rule` defined
@@ -127,3 +260,114 @@ class CleanUPTables(models.Model):
         if keep_hours:
             return _date
         return datetime.combine(_date, datetime.max.time())
+
+    def get_previous_cutoff(self):
+        """
+        Get the cutoff date of the last incremental execution, naive like `get_date`. None when the table is not
+        incremental or has no previous cutoff, so all the expired rows are deleted.
+        """
+
+        if not self.incremental or self.last_cutoff is None:
+            return None
+        if timezone.is_aware(self.last_cutoff):
+            return timezone.make_naive(self.last_cutoff)
+        return self.last_cutoff
+
+    def get_eta(self):
+        """
+        Get the seconds estimated to finish the execution in progress, None without rows estimate or throughput
+        """
+
+        if not self.estimated_rows or not self.current_rows_per_second:
+            return None
+        return max(self.estimated_rows - self.logs_deleted, 0) / self.current_rows_per_second
+
+    def get_cadence(self):
+        """
+        Get the seconds between executions, the `cadence` or the one of the priority
+        """
+
+        if self.cadence:
+            return self.cadence
+        cadences = getattr(settings, 'CLEANUP_TABLES_CADENCE_BY_PRIORITY', CleanUPTableConstants.CADENCE_BY_PRIORITY)
+        return cadences.get(self.priority, CleanUPTableConstants.CADENCE_BY_PRIORITY[NORMAL])
+
+    def is_due(self):
+        """
+        Validate if the cadence passed since the last execution
+        """
+
+        if not self.last_executed:
+            return True
+        now = timezone.now() if timezone.is_aware(self.last_executed) else datetime.now()
+        return (now - self.last_executed).total_seconds() >= self.get_cadence()
+
+
+class CleanUPTablesArchive(models.Model):
+    """
+    Model to manage the files where the deleted rows of a table are archived
+    """
+
+    def get_upload_path(self, filename):
+        now = datetime.now()
+        return os.path.join(
+            'cleanup_archives', slugify(self.table.table_name), str(now.year), str(now.month), filename
+        )
+
+    table = models.ForeignKey(CleanUPTables, related_name='archives', on_delete=models.CASCADE)
+    archive_file = models.FileField(upload_to=get_upload_path)
+    rows = models.BigIntegerField(default=0)
+    size = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return u'{0}'.format(self.archive_file.name)
+
+
+class CleanUPRun(models.Model):
+    """
+    Model to keep the history of the executions of a table
+    """
+
+    table = models.ForeignKey(CleanUPTables, related_name='runs', on_delete=models.CASCADE)
+    strategy = models.CharField(max_length=100, choices=CLEAN_UP_STRATEGY_OPTIONS)
+    status = models.CharField(max_length=100, choices=CLEAN_UP_STATUS_OPTIONS, default=CLEANING)
+    resumed = models.BooleanField(default=False)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    batches = models.PositiveIntegerField(default=0)
+    rows_deleted = models.BigIntegerField(default=0)
+    p50_batch_seconds = models.FloatField(null=True, blank=True)
+    p95_batch_seconds = models.FloatField(null=True, blank=True)
+    max_batch_seconds = models.FloatField(null=True, blank=True)
+    maintenance_seconds = models.FloatField(null=True, blank=True)
+    retries = models.PositiveIntegerField(default=0)
+    retry_seconds = models.FloatField(default=0)
+    errors = models.TextField(blank=True, null=True)
+
+    def __unicode__(self):
+        return u'{0} {1}'.format(self.table.table_name, self.started_at)
+
+    def set_batch_latencies(self, latencies):
+        """
+        Set the batches and their p50, p95 and max latency
+
+        Args:
+            latencies (list): Seconds taken by each batch
+        """
+
+        latencies = sorted(latencies)
+        self.batches = len(latencies)
+        if not latencies:
+            return
+        self.p50_batch_seconds = self.get_percentile(latencies, 50)
+        self.p95_batch_seconds = self.get_percentile(latencies, 95)
+        self.max_batch_seconds = latencies[-1]
+
+    @staticmethod
+    def get_percentile(values, percent):
+        """
+        Get the nearest-rank percentile of sorted values
+        """
+
+        return values[max(int(math.ceil(percent / 100.0 * len(values))) - 1, 0)]
@@ -0,0 +1,132 @@
+import re
+
+from dateutil import parser
+from django.db import transaction
+from django.utils import timezone
+
+from cleanup_tables.choices import DETACH
+
+
+class CleanUPPartitionsMixin(object):
+    """
+    Class to remove the expired partitions of the PostgreSQL tables partitioned by range on the `date_field`
+    """
+
+    PARTITION_KEY_REGEX = r'^RANGE \("?{0}"?\)$'
+    PARTITION_UPPER_BOUND_REGEX = r"TO \('([^']+)'\)$"
+
+    def _delete_partition(self):
+        """
+        Drop or detach the partitions whose rows are all before the cleanup date, archiving their rows first when
+        the table archives them, then delete the rows left in the boundary partition with the keyset strategy.
+        The partition pruning keeps those batches out of the partitions that have no expired rows.
+        Tables that are not partitioned only use the keyset strategy.
+        """
+
+        if self._is_partitioned_by_date_field():
+            for partition_name, rows in self._get_expired_partitions():
+                with self._instrument_batch():
+                    if self.archiver:
+                        self._archive_rows('SELECT * FROM {0}'.format(partition_name))
+                    self._remove_partition(partition_name)
+                    if self.archiver:
+                        self.archiver.commit()
+                    self.logs_deleted += rows
+                self._save_progress()
+                if not self._pace():
+                    return
+        self._delete_keyset()
+
+    def _is_partitioned_by_date_field(self):
+        """
+        Validate if the table is partitioned by range on the `date_field`
+        """
+
+        if self.connection.vendor != 'postgresql':
+            return False
+
+        partition_key = self._fetch_value(
+            "SELECT pg_get_partkeydef(oid) FROM pg_class WHERE oid = %s::regclass AND relkind = 'p'",
+            [self._db_table_name()]
+        )
+        return bool(partition_key and re.match(self.PARTITION_KEY_REGEX.format(self.date_field), partition_key))
+
+    def _get_expired_partitions(self):
+        """
+        Get the partitions whose upper bound is not after the cleanup date. The upper bound is exclusive, so all
+        their rows are expired.
+
+        Returns:
+            list: Tuples with the partition name and its rows, taken from the partition statistics
+        """
+
+        sql = """
+            SELECT
+              child.oid::regclass::text,
+              pg_get_expr(child.relpartbound, child.oid),
+              GREATEST(child.reltuples::bigint, COALESCE(stats.n_live_tup, 0))
+              FROM pg_inherits
+              JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+              LEFT JOIN pg_stat_user_tables stats ON stats.relid = child.oid
+              WHERE pg_inherits.inhparent = %s::regclass
+        """
+        expired_partitions = []
+        for partition_name, partition_bound, rows in self._fetch_all(sql, [self._db_table_name()]):
+            upper_bound = self._get_partition_upper_bound(partition_bound)
+            if upper_bound is not None and upper_bound <= self._get_comparable_date(upper_bound):
+                expired_partitions.append((partition_name, rows))
+        return expired_partitions
+
+    def _get_partition_upper_bound(self, partition_bound):
+        """
+        Get the upper bound of a range partition, None for the default partition and MAXVALUE bounds
+        """
+
+        match = re.search(self.PARTITION_UPPER_BOUND_REGEX, partition_bound or '')
+        if not match:
+            return None
+        return parser.parse(match.group(1))
+
+    def _get_comparable_date(self, upper_bound):
+        """
+        Get the cleanup date with the same timezone awareness than the partition bound
+        """
+
+        if timezone.is_aware(upper_bound) and timezone.is_naive(self.date_rule):
+            return timezone.make_aware(self.date_rule)
+        if timezone.is_naive(upper_bound) and timezone.is_aware(self.date_rule):
+            return timezone.make_naive(self.date_rule)
+        return self.date_rule
+
+    def _has_default_partition(self):
+        """
+        Validate if the table has a default partition
+        """
+
+        return bool(self._fetch_value(
+            'SELECT partdefid <> 0 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [self._db_table_name()]
+        ))
+
+    def _remove_partition(self, partition_name):
+        """
+        Detach the partition without blocking the queries on the table and drop it, unless the table is configured
+        to only detach its partitions.
+
+        PostgreSQL can't detach a partition concurrently when the table has a default partition, so those tables
+        detach it in a transaction that gives up after the `lock_timeout` of the batches instead of queueing the
+        queries on the table behind its lock.
+        """
+
+        if self._has_default_partition():
+            with transaction.atomic(using=self.using):
+                for sql in self.dialect.get_timeout_statements(self.lock_timeout, None):
+                    self._execute_statement(sql)
+                self._execute_statement('ALTER TABLE {0} DETACH PARTITION {1}'.format(
+                    self._db_table_name(), partition_name
+                ))
+        else:
+            self._execute_statement('ALTER TABLE {0} DETACH PARTITION {1} CONCURRENTLY'.format(
+                self._db_table_name(), partition_name
+            ))
+        if self.table.partition_action != DETACH:
+            self._execute_statement('DROP TABLE {0}'.format(partition_name))
@@ -0,0 +1,149 @@
+import json
+import re
+
+from cleanup_tables.choices import LEGACY
+from cleanup_tables.dialects import get_dialect
+from cleanup_tables.models import CleanUPTables
+
+
+class CleanUPPlannerMixin(object):
+    """
+    Class to plan the cleanup of the tables without deleting anything. It builds the statement that selects the rows
+    of the first batch, the batch delete for the legacy strategy and the upper bound query of the keyset ones, and
+    asks the database for its plan with EXPLAIN, which doesn't execute it.
+    """
+
+    SQLITE_FULL_SCAN_REGEX = r'^SCAN (TABLE )?{0}\b(?!.*USING)'
+
+    def _plan_table(self, table):
+        """
+        Get the plan of the first batch of a table
+
+        Returns:
+            dict: The strategy, the SQL explained, the rows and cost estimated by the database, the scans of the
+                table, if any of them reads the whole table, and the warnings about its indexes
+        """
+
+        self.table = table
+        self.model_class = table.get_model_class(table.table_name)
+        self.using = self._db_alias(self.model_class)
+        self.dialect = get_dialect(self.connection.vendor)
+        self.date_rule = table.get_date()
+        self.previous_cutoff = table.get_previous_cutoff()
+        self.date_field = table.date_field
+        self.strategy = self._get_strategy(table)
+        self.batch_size = self._get_batch_size(table)
+        self.slice = None
+        self._sql = {}
+
+        sql, params = self._get_batch_statement()
+        plan = {
+            'strategy': self.strategy,
+            'sql': sql,
+            'rows': None,
+            'cost': None,
+            'scans': [],
+            'full_scan': False,
+            'warnings': CleanUPTables.get_index_warnings(self.model_class, self.date_field),
+            'errors': None,
+        }
+        explain = getattr(self, '_explain_{0}'.format(self.connection.vendor), None)
+        if explain is None:
+            plan['errors'] = 'EXPLAIN is not supported for the {0} database.'.format(self.connection.vendor)
+            return plan
+
+        try:
+            plan.update(explain(sql, params))
+        except Exception as err:
+            self._manage_transaction(transaction_type='rollback')
+            plan['errors'] = '{0}'.format(err)
+        return plan
+
+    def _get_batch_statement(self):
+        """
+        Get the statement that selects the rows of the first batch and its parameters
+        """
+
+        if self.strategy == LEGACY:
+            self.sql_raw = self._open_sql_file(self.table.sql_file)
+            return self._get_sql(), self._db_params()
+
+        sql_keyset_bound_raw = self._open_sql_file(None, self.SQL_KEYSET_BOUND_NAME)
+        watermark_condition, params = self._db_watermark_condition(None)
+        return self._get_sql(sql_keyset_bound_raw, watermark_condition=watermark_condition), self._db_params(**params)
+
+    def _explain_postgresql(self, sql, params):
+        """
+        Get the plan of PostgreSQL, its scans are the nodes of the plan tree that read the table
+        """
+
+        plan = self._fetch_value('EXPLAIN (FORMAT JSON) {0}'.format(sql), params)
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        plan = plan[0]['Plan']
+        scans = [
+            '{0}{1}'.format(node['Node Type'], ' using {0}'.format(node['Index Name']) if 'Index Name' in node else '')
+            for node in self._walk_plan(plan, 'Plans') if node.get('Relation Name') == self._db_table_name()
+        ]
+        return {
+            'rows': plan.get('Plan Rows'),
+            'cost': plan.get('Total Cost'),
+            'scans': scans,
+            'full_scan': any(scan.startswith('Seq Scan') for scan in scans),
+        }
+
+    def _explain_mysql(self, sql, params):
+        """
+        Get the plan of MySQL, its scans are the access types of the table
+        """
+
+        plan = json.loads(self._fetch_value('EXPLAIN FORMAT=JSON {0}'.format(sql), params))
+        tables = [
+            node['table'] for node in self._walk_plan(plan, None)
+            if isinstance(node.get('table'), dict) and node['table'].get('table_name') == self._db_table_name()
+        ]
+        scans = [
+            '{0}{1}'.format(node.get('access_type'), ' using {0}'.format(node['key']) if node.get('key') else '')
+            for node in tables
+        ]
+        return {
+            'rows': sum(node.get('rows_examined_per_scan', 0) for node in tables) or None,
+            'cost': plan.get('query_block', {}).get('cost_info', {}).get('query_cost'),
+            'scans': scans,
+            'full_scan': any(node.get('access_type') == 'ALL' for node in tables),
+        }
+
+    def _explain_sqlite(self, sql, params):
+        """
+        Get the plan of SQLite, it has no rows or cost estimates. A scan of the table without index reads it whole.
+        """
+
+        full_scan_regex = self.SQLITE_FULL_SCAN_REGEX.format(re.escape(self._db_table_name()))
+        scans = [
+            row[-1] for row in self._fetch_all('EXPLAIN QUERY PLAN {0}'.format(sql), params)
+            if re.search(r'\b{0}\b'.format(re.escape(self._db_table_name())), row[-1])
+        ]
+        return {
+            'scans': scans,
+            'full_scan': any(re.match(full_scan_regex, scan) for scan in scans),
+        }
+
+    @classmethod
+    def _walk_plan(cls, node, children_key):
+        """
+        Get all the nodes of a plan tree. Without `children_key` every dict or list value is visited.
+        """
+
+        if isinstance(node, list):
+            for child in node:
+                for descendant in cls._walk_plan(child, children_key):
+                    yield descendant
+            return
+        if not isinstance(node, dict):
+            return
+
+        yield node
+        children = node.get(children_key, []) if children_key else list(node.values())
+        for child in children:
+            for descendant in cls._walk_plan(child, children_key):
+                yield descendant
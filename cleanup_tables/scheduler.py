@@ -0,0 +1,151 @@
+import heapq
+import math
+from datetime import datetime
+
+from django.utils import timezone
+
+from cleanup_tables.choices import HIGH, NORMAL, LOW
+
+
+class CleanUPScheduler(object):
+    """
+    Class to order the tables and fit them in the maintenance window from the history of their executions.
+
+    The backlog of a table is the expired rows left by its last execution plus its backlog growth since then, and its
+    time to drain is the backlog over its throughput. The tables run by value per second, the priority weight times
+    the throughput, so the window deletes the most valuable rows first. The tables without history run after the
+    others, with the time left, to measure it.
+
+    The time to drain only packs the tables in the lanes. Each table gets as time budget all the time left in the
+    window when it starts, so a table slower than its history isn't stopped while the window has time. The plan is
+    made before the first table starts: a scheduled table is not promised a start, the manager defers it when the
+    tables before it took the window.
+    """
+
+    PRIORITY_WEIGHTS = {
+        HIGH: 3,
+        NORMAL: 2,
+        LOW: 1,
+    }
+
+    def __init__(self, window=None, deadline=None, lanes=1, min_seconds=60):
+        """
+        Create an instance with the default values.
+        Args:
+            window (int, optional): Seconds available to clean the tables, no limit by default
+            deadline (datetime, optional): Date when the cleanup must be finished, no limit by default
+            lanes (int, optional): Tables cleaned at the same time
+            min_seconds (int, optional): Seconds left in the window needed to start a table
+        """
+
+        self.window = window
+        self.deadline = deadline
+        self.lanes = max(lanes, 1)
+        self.min_seconds = min_seconds
+
+    def plan(self, tables):
+        """
+        Order the tables and give them their time budget
+
+        Args:
+            tables (iterable): CleanUPTables instances to clean
+
+        Returns:
+            tuple: The list of tables to clean, in order, with their time budget in seconds (None without window)
+                and the list of deferred tables with the reason
+        """
+
+        available = self.get_available_seconds()
+        estimates = [(table, self.estimate_seconds(table)) for table in tables]
+        estimates.sort(key=lambda estimate: self._get_order(*estimate))
+
+        lanes = [0.0] * self.lanes
+        scheduled, deferred = [], []
+        for table, seconds in estimates:
+            start = heapq.heappop(lanes)
+            if available is None:
+                scheduled.append((table, None))
+                heapq.heappush(lanes, start + (seconds or 0))
+                continue
+
+            left = available - start
+            if left < self.min_seconds:
+                deferred.append((table, self._get_deferred_reason(start, available, seconds)))
+                heapq.heappush(lanes, start)
+                continue
+
+            scheduled.append((table, int(math.ceil(left))))
+            heapq.heappush(lanes, start + (left if seconds is None else min(seconds, left)))
+        return scheduled, deferred
+
+    def get_available_seconds(self):
+        """
+        Get the seconds available to clean the tables, the shortest of the window and the time left to the deadline
+        """
+
+        limits = []
+        if self.window:
+            limits.append(self.window)
+        if self.deadline:
+            limits.append(max((self.deadline - self._now(self.deadline)).total_seconds(), 0))
+        return min(limits) if limits else None
+
+    def estimate_backlog(self, table):
+        """
+        Get the expired rows estimated for the table, None when it has no history
+        """
+
+        if table.backlog_rows is None:
+            return None
+        growth = (table.backlog_growth or 0) * self.seconds_since(table.last_executed)
+        return table.backlog_rows + max(growth, 0)
+
+    def estimate_seconds(self, table):
+        """
+        Get the seconds estimated to drain the backlog of the table, None when it has no history
+        """
+
+        backlog = self.estimate_backlog(table)
+        if backlog is None or not table.rows_per_second:
+            return None
+        return backlog / table.rows_per_second
+
+    def _get_order(self, table, seconds):
+        """
+        Get the sort key of a table: the tables with history first, the ones with backlog before the drained ones,
+        then the highest value per second
+        """
+
+        if seconds is None:
+            return True, True, -self.PRIORITY_WEIGHTS.get(table.priority, 1)
+        return False, seconds <= 0, -self.PRIORITY_WEIGHTS.get(table.priority, 1) * table.rows_per_second
+
+    def _get_deferred_reason(self, start, available, seconds):
+        """
+        Get the reason why a table is not cleaned in this window
+        """
+
+        if available <= 0:
+            return 'The deadline is over.'
+        return 'The window is full: the table would start after {0} of {1} seconds available{2}.'.format(
+            int(start), int(available),
+            '' if seconds is None else ', it needs {0} seconds to drain its backlog'.format(int(math.ceil(seconds)))
+        )
+
+    @classmethod
+    def seconds_since(cls, date):
+        """
+        Get the seconds since a date, 0 when there is no date
+        """
+
+        if not date:
+            return 0
+        return max((cls._now(date) - date).total_seconds(), 0)
+
+    @staticmethod
+    def _now(date):
+        """
+        Get the current date with the same timezone awareness than `date`
+        """
+
+        return timezone.now() if timezone.is_aware(date) else datetime.now()
@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+# Sent before each batch of a table, with the `manager` (CleanUPTablesManager), the `table` (CleanUPTables instance),
+# the `strategy` and the `batch_size`. A batch rolled back by a transient error is sent again when it is retried, and
+# the last batch of the keyset strategies, which finds no rows left to delete, is sent without `batch_finished`.
+batch_started = Signal()
+
+# Sent after each committed batch of a table, with the same arguments than `batch_started` plus the `rows` deleted by
+# the batch and the `seconds` it took.
+batch_finished = Signal()
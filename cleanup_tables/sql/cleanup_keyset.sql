@@ -0,0 +1,4 @@
+DELETE
+  FROM {db_table_name}
+  WHERE {db_condition}{watermark_condition}
+    AND {primary_key_name} <= %(upper_bound)s
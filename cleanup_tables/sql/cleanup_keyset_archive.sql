@@ -0,0 +1,5 @@
+SELECT
+  *
+  FROM {db_table_name}
+  WHERE {db_condition}{watermark_condition}
+    AND {primary_key_name} <= %(upper_bound)s
@@ -0,0 +1,11 @@
+SELECT
+  MAX({primary_key_name})
+  FROM (
+    SELECT
+    {primary_key_name}
+    FROM {db_table_name}
+    WHERE {db_condition}{watermark_condition}
+    ORDER BY
+      {primary_key_name} ASC
+    OFFSET 0 ROWS
+    FETCH NEXT {limit} ROWS ONLY) batch
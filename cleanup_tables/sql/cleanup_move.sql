@@ -0,0 +1,10 @@
+WITH moved AS (
+  DELETE
+    FROM {db_table_name}
+    WHERE {db_condition}{watermark_condition}
+      AND {primary_key_name} <= %(upper_bound)s
+    RETURNING {columns})
+INSERT INTO {archive_table_name} ({columns})
+  SELECT
+  {columns}
+  FROM moved
@@ -0,0 +1,6 @@
+INSERT INTO {archive_table_name} ({columns})
+  SELECT
+  {columns}
+  FROM {db_table_name}
+  WHERE {db_condition}{watermark_condition}
+    AND {primary_key_name} <= %(upper_bound)s
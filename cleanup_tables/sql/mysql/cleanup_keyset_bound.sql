@@ -0,0 +1,10 @@
+SELECT
+  MAX({primary_key_name})
+  FROM (
+    SELECT
+    {primary_key_name}
+    FROM {db_table_name}
+    WHERE {db_condition}{watermark_condition}
+    ORDER BY
+      {primary_key_name} ASC
+    LIMIT {limit}) batch
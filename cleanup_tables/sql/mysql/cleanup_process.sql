@@ -0,0 +1,6 @@
+DELETE
+  FROM {db_table_name}
+  WHERE {db_condition}
+  ORDER BY
+    {primary_key_name} ASC
+  LIMIT {limit}
@@ -0,0 +1,9 @@
+DELETE
+  FROM {db_table_name}
+  WHERE {primary_key_name} IN (
+    SELECT
+    {primary_key_name}
+    FROM {db_table_name}
+    WHERE {db_condition}{watermark_condition}
+      AND {primary_key_name} <= %(upper_bound)s
+    FOR UPDATE SKIP LOCKED)
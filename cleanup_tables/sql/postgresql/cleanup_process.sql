@@ -0,0 +1,8 @@
+DELETE
+  FROM {db_table_name}
+  WHERE ctid = ANY(ARRAY(
+    SELECT
+    ctid
+    FROM {db_table_name}
+    WHERE {db_condition}
+    LIMIT {limit}))
@@ -0,0 +1,8 @@
+DELETE
+  FROM {db_table_name}
+  WHERE rowid IN (
+    SELECT
+    rowid
+    FROM {db_table_name}
+    WHERE {db_condition}
+    LIMIT {limit})
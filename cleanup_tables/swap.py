@@ -0,0 +1,312 @@
+import logging
+import re
+
+from django.conf import settings
+from django.db import models, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class CleanUPSwapMixin(object):
+    """
+    Class to clean PostgreSQL tables where most rows are expired by copying the rows to keep into a shadow table and
+    swapping both tables, instead of deleting the expired rows in batches.
+
+    A trigger logs the primary keys of the rows inserted, updated or deleted while the copy runs, and only those rows
+    are copied again under an exclusive lock before the swap, so the lock lasts as long as the changes, not the table.
+    The privileges of the table are granted on the shadow table; the tables with triggers, row level security or
+    column privileges, which the shadow table wouldn't keep, are not swapped.
+    """
+
+    SWAP_SUFFIX = '_swap'
+    OLD_SUFFIX = '_old'
+    CHANGES_SUFFIX = '_changes'
+    INDEX_DEFINITION_REGEX = r'^CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+ '
+
+    def _should_swap(self, table):
+        """
+        Validate if the expired fraction of the table estimated by the planner is above the swap threshold
+        """
+
+        threshold = table.swap_threshold or getattr(settings, 'CLEANUP_TABLES_SWAP_THRESHOLD', None)
+        if not threshold or not self.estimated_rows or self.connection.vendor != 'postgresql' or table.archive_format:
+            return False
+
+        table_rows = self._db_table_rows()
+        return bool(table_rows and self.estimated_rows / table_rows >= threshold)
+
+    def _delete_swap(self):
+        """
+        Copy the rows to keep into a shadow table, rebuild its indexes and constraints and swap the table names.
+        Tables referenced by foreign keys can't be swapped without breaking them, the expired rows of the
+        tables that archive them are never read, the rows of the tables without an integer primary key can't be
+        matched cheaply between both tables and the tables with objects the shadow table wouldn't keep lose them, so
+        all of them use the keyset strategy.
+        """
+
+        if (self.connection.vendor != 'postgresql' or self.archiver or
+                not isinstance(self.model_class._meta.pk, models.IntegerField) or
+                self._has_referencing_foreign_keys()):
+            self._delete_keyset()
+            return
+        reason = self._get_swap_blocker()
+        if reason:
+            logger.info('Table %s is not swapped, %s', self._db_table_name(), reason)
+            self._delete_keyset()
+            return
+
+        table_name = self._db_table_name()
+        shadow_name = self._get_swap_name(table_name, self.SWAP_SUFFIX)
+        changes_name = self._get_swap_name(table_name, self.CHANGES_SUFFIX)
+        table_rows = self._db_table_rows()
+        try:
+            self._execute_statement('DROP TABLE IF EXISTS {0}'.format(shadow_name))
+            self._execute_statement('CREATE TABLE {0} (LIKE {1} INCLUDING ALL EXCLUDING INDEXES)'.format(
+                shadow_name, table_name
+            ))
+            self._copy_grants(shadow_name)
+            self._capture_changes(changes_name)
+            rows_kept = self._copy_rows_to_keep(shadow_name)
+            renames = self._copy_indexes(shadow_name) + self._copy_foreign_keys(shadow_name)
+            with transaction.atomic(using=self.using):
+                self._execute_statement('LOCK TABLE {0} IN ACCESS EXCLUSIVE MODE'.format(table_name))
+                rows_kept += self._copy_changed_rows(shadow_name, changes_name)
+                self._move_sequences(shadow_name)
+                self._swap_tables(shadow_name, renames)
+        except Exception:
+            self._execute_statement('DROP TABLE IF EXISTS {0}'.format(shadow_name))
+            raise
+        finally:
+            self._drop_change_capture(changes_name)
+
+        for constraint_name in self._fetch_not_valid_foreign_keys():
+            self._execute_statement('ALTER TABLE {0} VALIDATE CONSTRAINT {1}'.format(table_name, constraint_name))
+        self.logs_deleted += max(int(table_rows or 0) - rows_kept, 0)
+        self._save_progress()
+
+    def _get_swap_name(self, name, suffix):
+        """
+        Get a temporary name that fits in the PostgreSQL identifiers length
+        """
+
+        return '{0}{1}'.format(name[:self.connection.ops.max_name_length() - len(suffix)], suffix)
+
+    def _has_referencing_foreign_keys(self):
+        """
+        Validate if other tables, or the table itself, have foreign keys to the table
+        """
+
+        return bool(self._fetch_value(
+            "SELECT COUNT(*) FROM pg_constraint WHERE confrelid = %s::regclass AND contype = 'f'",
+            [self._db_table_name()]
+        ))
+
+    def _get_swap_blocker(self):
+        """
+        Get the reason why the table can't be swapped without losing objects that `CREATE TABLE ... LIKE` doesn't
+        copy, None when it can be swapped
+        """
+
+        sql = """
+            SELECT
+              (SELECT COUNT(*) FROM pg_trigger WHERE tgrelid = pg_class.oid AND NOT tgisinternal),
+              relrowsecurity OR EXISTS (SELECT 1 FROM pg_policy WHERE polrelid = pg_class.oid),
+              EXISTS (SELECT 1 FROM pg_attribute WHERE attrelid = pg_class.oid AND attacl IS NOT NULL)
+              FROM pg_class
+              WHERE oid = %s::regclass
+        """
+        triggers, row_security, column_privileges = self._fetch_row(sql, [self._db_table_name()])
+        if triggers:
+            return 'it has triggers.'
+        if row_security:
+            return 'it has row level security.'
+        if column_privileges:
+            return 'it has column privileges.'
+        return None
+
+    def _copy_grants(self, shadow_name):
+        """
+        Grant on the shadow table the privileges granted on the table
+        """
+
+        sql = """
+            SELECT
+              privilege_type,
+              CASE WHEN grantee = 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(grantee)) END,
+              is_grantable
+              FROM pg_class, aclexplode(relacl)
+              WHERE oid = %s::regclass
+        """
+        for privilege, grantee, grantable in self._fetch_all(sql, [self._db_table_name()]):
+            self._execute_statement('GRANT {0} ON {1} TO {2}{3}'.format(
+                privilege, shadow_name, grantee, ' WITH GRANT OPTION' if grantable else ''
+            ))
+
+    def _capture_changes(self, changes_name):
+        """
+        Log the primary keys of the rows inserted, updated or deleted in the table from now on, before the copy takes
+        its snapshot. Creating the trigger waits for the transactions writing in the table, so the changes that
+        the copy doesn't see are all logged.
+        """
+
+        table_name = self._db_table_name()
+        primary_key_name = self.model_class._meta.pk.column
+        self._drop_change_capture(changes_name)
+        self._execute_statement('CREATE UNLOGGED TABLE {0} AS SELECT {1} FROM {2} WITH NO DATA'.format(
+            changes_name, primary_key_name, table_name
+        ))
+        self._execute_statement(
+            'CREATE FUNCTION {0}() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+            'IF TG_OP <> \'INSERT\' THEN INSERT INTO {0} VALUES (OLD.{1}); END IF; '
+            'IF TG_OP <> \'DELETE\' THEN INSERT INTO {0} VALUES (NEW.{1}); END IF; '
+            'RETURN NULL; END $$'.format(changes_name, primary_key_name)
+        )
+        self._execute_statement(
+            'CREATE TRIGGER {0} AFTER INSERT OR UPDATE OR DELETE ON {1} FOR EACH ROW EXECUTE PROCEDURE {0}()'.format(
+                changes_name, table_name
+            )
+        )
+
+    def _drop_change_capture(self, changes_name):
+        """
+        Drop the trigger, its function and the table of the changes. After the swap the trigger was dropped with the
+        old table.
+        """
+
+        self._execute_statement('DROP TRIGGER IF EXISTS {0} ON {1}'.format(changes_name, self._db_table_name()))
+        self._execute_statement('DROP FUNCTION IF EXISTS {0}()'.format(changes_name))
+        self._execute_statement('DROP TABLE IF EXISTS {0}'.format(changes_name))
+
+    def _copy_rows_to_keep(self, shadow_name):
+        """
+        Copy the rows that are not expired, rows without date included, and return the rows copied
+        """
+
+        sql = 'INSERT INTO {0} OVERRIDING SYSTEM VALUE SELECT * FROM {1} WHERE ({2}) IS NOT TRUE'.format(
+            shadow_name, self._db_table_name(), self._db_condition()
+        )
+        cursor = self._get_cursor()
+        cursor.execute(sql, self._db_params())
+        return max(cursor.rowcount, 0)
+
+    def _copy_changed_rows(self, shadow_name, changes_name):
+        """
+        Copy again the rows changed during the copy, found by the primary keys logged, and return the rows added to
+        the shadow table. It runs under the exclusive lock of the table, its cost follows the changes logged.
+        """
+
+        primary_key_name = self.model_class._meta.pk.column
+        changed = '{0} IN (SELECT {0} FROM {1})'.format(primary_key_name, changes_name)
+        cursor = self._get_cursor()
+        cursor.execute('DELETE FROM {0} WHERE {1}'.format(shadow_name, changed))
+        rows_removed = max(cursor.rowcount, 0)
+        sql = 'INSERT INTO {0} OVERRIDING SYSTEM VALUE SELECT * FROM {1} WHERE ({2}) IS NOT TRUE AND {3}'.format(
+            shadow_name, self._db_table_name(), self._db_condition(), changed
+        )
+        cursor.execute(sql, self._db_params())
+        return max(cursor.rowcount, 0) - rows_removed
+
+    def _copy_indexes(self, shadow_name):
+        """
+        Build the indexes of the table in the shadow table with temporary names. The indexes of primary keys and
+        unique constraints are attached to the same constraints.
+
+        Returns:
+            list: Tuples with the statement to give its original name back and the original name
+        """
+
+        sql = """
+            SELECT
+              index_class.relname,
+              pg_get_indexdef(pg_index.indexrelid),
+              pg_constraint.conname,
+              pg_constraint.contype
+              FROM pg_index
+              JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+              LEFT JOIN pg_constraint ON pg_constraint.conindid = pg_index.indexrelid
+                AND pg_constraint.conrelid = pg_index.indrelid
+              WHERE pg_index.indrelid = %s::regclass
+        """
+        renames = []
+        for index_name, index_definition, constraint_name, constraint_type in self._fetch_all(
+                sql, [self._db_table_name()]):
+            swap_index_name = self._get_swap_name(index_name, self.SWAP_SUFFIX)
+            self._execute_statement(re.sub(
+                self.INDEX_DEFINITION_REGEX,
+                lambda match: 'CREATE {0}INDEX {1} ON {2} '.format(match.group(1) or '', swap_index_name, shadow_name),
+                index_definition
+            ))
+            if constraint_type in ('p', 'u'):
+                self._execute_statement('ALTER TABLE {0} ADD CONSTRAINT {1} {2} USING INDEX {1}'.format(
+                    shadow_name, swap_index_name, 'PRIMARY KEY' if constraint_type == 'p' else 'UNIQUE'
+                ))
+                renames.append(('ALTER TABLE {table_name} RENAME CONSTRAINT {0} TO {1}', swap_index_name,
+                                constraint_name))
+            else:
+                renames.append(('ALTER INDEX {0} RENAME TO {1}', swap_index_name, index_name))
+        return renames
+
+    def _copy_foreign_keys(self, shadow_name):
+        """
+        Add the foreign keys of the table to the shadow table as NOT VALID, they are validated after the swap.
+
+        Returns:
+            list: Tuples with the statement to give its original name back and the original name
+        """
+
+        sql = "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass " \
+              "AND contype = 'f'"
+        renames = []
+        for constraint_name, constraint_definition in self._fetch_all(sql, [self._db_table_name()]):
+            swap_constraint_name = self._get_swap_name(constraint_name, self.SWAP_SUFFIX)
+            self._execute_statement('ALTER TABLE {0} ADD CONSTRAINT {1} {2} NOT VALID'.format(
+                shadow_name, swap_constraint_name, constraint_definition
+            ))
+            renames.append(('ALTER TABLE {table_name} RENAME CONSTRAINT {0} TO {1}', swap_constraint_name,
+                            constraint_name))
+        return renames
+
+    def _move_sequences(self, shadow_name):
+        """
+        Give the sequences of the table to the shadow table. Serial columns share the same sequence, so it only
+        changes its owner to survive the drop of the table. Identity columns have their own sequence, so it
+        continues from the last value of the table.
+        """
+
+        sql = """
+            SELECT attname, attidentity, pg_get_serial_sequence(%s, attname)
+              FROM pg_attribute
+              WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        """
+        table_name = self._db_table_name()
+        for column_name, identity, sequence_name in self._fetch_all(sql, [table_name, table_name]):
+            if not sequence_name:
+                continue
+            if identity:
+                self._execute_statement('SELECT setval(pg_get_serial_sequence(%s, %s), last_value, is_called) '
+                                        'FROM {0}'.format(sequence_name), [shadow_name, column_name])
+            else:
+                self._execute_statement('ALTER SEQUENCE {0} OWNED BY {1}.{2}'.format(
+                    sequence_name, shadow_name, column_name
+                ))
+
+    def _swap_tables(self, shadow_name, renames):
+        """
+        Replace the table with the shadow table, drop the old one and give the original names back
+        """
+
+        table_name = self._db_table_name()
+        old_name = self._get_swap_name(table_name, self.OLD_SUFFIX)
+        self._execute_statement('ALTER TABLE {0} RENAME TO {1}'.format(table_name, old_name))
+        self._execute_statement('ALTER TABLE {0} RENAME TO {1}'.format(shadow_name, table_name))
+        self._execute_statement('DROP TABLE {0}'.format(old_name))
+        for statement, swap_name, original_name in renames:
+            self._execute_statement(statement.format(swap_name, original_name, table_name=table_name))
+
+    def _fetch_not_valid_foreign_keys(self):
+        """
+        Get the foreign keys of the table that are not validated yet
+        """
+
+        sql = "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f' AND NOT convalidated"
+        return [row[0] for row in self._fetch_all(sql, [self._db_table_name()])]
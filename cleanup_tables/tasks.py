@@ -0,0 +1,115 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from cleanup_tables.constants import CleanUPTableConstants
+
+logger = logging.getLogger(__name__)
+
+
+class BaseTaskBackend(object):
+    """
+    Class to run the cleanup out of the request that launches it. The tasks are given by their dotted path and
+    keyword arguments, so a queue backend can serialize them.
+    """
+
+    def enqueue(self, task_name, **kwargs):
+        """
+        Run the task in the background
+
+        Args:
+            task_name (string): Dotted path of the task function
+            kwargs: Arguments of the task
+        """
+
+        raise NotImplementedError
+
+
+class ImmediateTaskBackend(BaseTaskBackend):
+    """
+    Run the task in the caller before returning, a local stand-in for the tests
+    """
+
+    def enqueue(self, task_name, **kwargs):
+        import_string(task_name)(**kwargs)
+
+
+class ThreadPoolTaskBackend(BaseTaskBackend):
+    """
+    Run the task in a pool of threads of the web process, settings.CLEANUP_TABLES_TASK_WORKERS threads at most.
+    The pool is shared by all the instances of the backend.
+    """
+
+    executor = None
+    executor_lock = threading.Lock()
+
+    def enqueue(self, task_name, **kwargs):
+        return self._get_executor().submit(self._run, task_name, kwargs)
+
+    @classmethod
+    def _get_executor(cls):
+        """
+        Get the pool, it is created by the first task
+        """
+
+        with cls.executor_lock:
+            if cls.executor is None:
+                cls.executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'CLEANUP_TABLES_TASK_WORKERS', CleanUPTableConstants.TASK_WORKERS),
+                    thread_name_prefix='cleanup_tables'
+                )
+        return cls.executor
+
+    @staticmethod
+    def _run(task_name, kwargs):
+        """
+        Run a task in a pool thread and close its database connections when it is done
+        """
+
+        try:
+            import_string(task_name)(**kwargs)
+        except Exception:
+            logger.exception('Task %s failed', task_name)
+        finally:
+            connections.close_all()
+
+
+def get_task_backend():
+    """
+    Get the backend of settings.CLEANUP_TABLES_TASK_BACKEND, the thread pool by default
+    """
+
+    return import_string(getattr(
+        settings, 'CLEANUP_TABLES_TASK_BACKEND', 'cleanup_tables.tasks.ThreadPoolTaskBackend'
+    ))()
+
+
+def cleanup_table(instance_id, user_id=None):
+    """
+    Task to clean one table
+
+    Args:
+        instance_id (int): A CleanUPTable instance ID
+        user_id (int, optional): ID of the user who launch the process
+    """
+
+    from cleanup_tables.core import CleanUPTablesManager
+
+    CleanUPTablesManager(instance_id=instance_id, user_id=user_id).cleanup()
+
+
+def build_index(instance_id):
+    """
+    Task to build the index of one table with `auto_index`
+
+    Args:
+        instance_id (int): A CleanUPTable instance ID
+    """
+
+    from cleanup_tables.core import CleanUPTablesManager
+
+    CleanUPTablesManager(instance_id=instance_id).build_indexes()
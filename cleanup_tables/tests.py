@@ -1,3 +1,1110 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, models
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from cleanup_tables.admin import CleanUPTablesAdmin
+from cleanup_tables.batching import AdaptiveBatchSize
+from cleanup_tables.cascade import CleanUPCascadeMixin
+from cleanup_tables.choices import (
+    CLEANING, DETACH, ERROR, HIGH, INDEX_BUILDING, INDEX_VALID, JSONL, KEYSET, LEGACY, LOW, MOVE, NEW, PARTIAL,
+    PARTITION, SUCCESS, SWAP
+)
+from cleanup_tables.constants import CleanUPTableConstants
+from cleanup_tables.core import CleanUPTablesManager
+from cleanup_tables.dialects import BaseDialect, get_dialect
+from cleanup_tables.exceptions import CascadeException
+from cleanup_tables.forms import CleanUPTablesForm
+from cleanup_tables.models import CleanUPRun, CleanUPTables
+from cleanup_tables.scheduler import CleanUPScheduler
+from cleanup_tables.signals import batch_finished, batch_started
+from cleanup_tables.throttling import BaseProbe, CleanUPThrottle
+
+
+class CleanUPTestLog(models.Model):
+    """
+    Table without dependents cleaned by the tests, its table is created by `CleanUPDatabaseTestCase`
+    """
+
+    created_at = models.DateTimeField()
+
+    class Meta:
+        app_label = 'cleanup_tables'
+
+
+class CleanUPTestEvent(models.Model):
+    """
+    Table with dependents cleaned by the tests
+    """
+
+    created_at = models.DateTimeField()
+
+    class Meta:
+        app_label = 'cleanup_tables'
+
+
+class CleanUPTestEventDetail(models.Model):
+    event = models.ForeignKey(CleanUPTestEvent, on_delete=models.CASCADE)
+
+    class Meta:
+        app_label = 'cleanup_tables'
+
+
+class CleanUPTestEventNote(models.Model):
+    event = models.ForeignKey(CleanUPTestEvent, null=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        app_label = 'cleanup_tables'
+
+
+class CleanUPTestEventRouter(object):
+    """
+    Router that writes the events in the `events` database
+    """
+
+    def db_for_write(self, model, **hints):
+        return 'events' if model is CleanUPTestEvent else None
+
+
+class StubProbe(BaseProbe):
+    """
+    Probe that returns the values given instead of measuring the database
+    """
+
+    def __init__(self, threshold, values):
+        super(StubProbe, self).__init__(threshold)
+        self.values = list(values)
+        self.calls = 0
+
+    def measure(self, manager):
+        self.calls += 1
+        return self.values.pop(0) if self.values else None
+
+
+class CleanUPSchedulerTests(SimpleTestCase):
+
+    def get_table(self, table_name, priority=HIGH, backlog_rows=None, rows_per_second=None):
+        return CleanUPTables(
+            table_name=table_name, priority=priority, backlog_rows=backlog_rows, rows_per_second=rows_per_second
+        )
+
+    def test_tables_without_window_are_ordered_by_value(self):
+        slow = self.get_table('slow', backlog_rows=1000, rows_per_second=10)
+        fast = self.get_table('fast', priority=LOW, backlog_rows=1000, rows_per_second=100)
+        new = self.get_table('new')
+        scheduled, deferred = CleanUPScheduler().plan([new, slow, fast])
+        self.assertEqual(scheduled, [(fast, None), (slow, None), (new, None)])
+        self.assertEqual(deferred, [])
+
+    def test_each_table_gets_the_time_left_in_the_window(self):
+        first = self.get_table('first', backlog_rows=600, rows_per_second=20)
+        second = self.get_table('second', backlog_rows=600, rows_per_second=10)
+        third = self.get_table('third', backlog_rows=600, rows_per_second=5)
+        scheduled, deferred = CleanUPScheduler(window=100, min_seconds=15).plan([first, second, third])
+        self.assertEqual(scheduled, [(first, 100), (second, 70)])
+        self.assertEqual([table for table, _ in deferred], [third])
+
+
+class CleanUPThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        self.manager = mock.Mock()
+
+    def test_waits_while_the_probe_is_overloaded(self):
+        probe = StubProbe(threshold=10, values=[50, 20, 5])
+        throttle = CleanUPThrottle(probes=[probe], pause_seconds=0)
+        self.assertTrue(throttle.wait(self.manager))
+        self.assertEqual(probe.calls, 3)
+
+    def test_probe_without_value_does_not_pause(self):
+        probe = StubProbe(threshold=10, values=[])
+        self.assertTrue(CleanUPThrottle(probes=[probe], pause_seconds=0).wait(self.manager))
+
+    def test_stops_when_the_deadline_is_over(self):
+        probe = StubProbe(threshold=10, values=[50] * 100)
+        throttle = CleanUPThrottle(probes=[probe], pause_seconds=0.01, deadline=time.monotonic() + 0.05)
+        self.assertFalse(throttle.wait(self.manager))
+        self.assertTrue(throttle.is_expired())
+
+    def test_duty_cycle_sleeps_in_proportion_to_the_batch(self):
+        throttle = CleanUPThrottle(duty_cycle=0.25)
+        throttle.last_batch_at = time.monotonic() - 1
+        with mock.patch.object(throttle, '_sleep') as sleep:
+            self.assertTrue(throttle.wait(self.manager))
+        self.assertAlmostEqual(sleep.call_args[0][0], 3, places=1)
+
+
+class CleanUPDatabaseTestCase(TransactionTestCase):
+    """
+    Create the tables of the test models, they are not in the migrations of the application
+    """
+
+    test_models = (CleanUPTestLog, CleanUPTestEvent, CleanUPTestEventDetail, CleanUPTestEventNote)
+
+    @classmethod
+    def setUpClass(cls):
+        super(CleanUPDatabaseTestCase, cls).setUpClass()
+        with connection.schema_editor() as editor:
+            for model in cls.test_models:
+                editor.create_model(model)
+        cls.media_root = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.test_models):
+                editor.delete_model(model)
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super(CleanUPDatabaseTestCase, cls).tearDownClass()
+
+    def setUp(self):
+        media_root = override_settings(MEDIA_ROOT=self.media_root)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        ContentType.objects.clear_cache()
+        ContentType.objects.get_for_models(*self.test_models)
+        self.user = User.objects.create(username='cleanup')
+        self.expired_date = timezone.now() - timedelta(days=30)
+        self.recent_date = timezone.now()
+
+    def create_table(self, model, **kwargs):
+        params = {
+            'table_name': model.__name__,
+            'date_field': 'created_at',
+            'clean_up_rule': '5_days',
+            'batch_size': 10,
+            'min_batch_size': 10,
+            'max_batch_size': 10,
+        }
+        params.update(kwargs)
+        return CleanUPTables.objects.create(**params)
+
+    def cleanup(self, table):
+        manager = CleanUPTablesManager(instance_id=table.pk, user_id=self.user.pk)
+        manager.cleanup()
+        table.refresh_from_db()
+        return manager
+
+    def create_logs(self, expired, recent):
+        CleanUPTestLog.objects.bulk_create(
+            [CleanUPTestLog(created_at=self.expired_date) for _ in range(expired)] +
+            [CleanUPTestLog(created_at=self.recent_date) for _ in range(recent)]
+        )
+
+    def get_archived_ids(self, table):
+        ids = []
+        for archive in table.archives.all():
+            with archive.archive_file.open('rb') as archive_file:
+                ids += [json.loads(line)['id'] for line in gzip.open(archive_file, 'rt')]
+        return ids
+
+
+class CleanUPTimeBudgetTests(CleanUPDatabaseTestCase):
+
+    def test_table_stops_partial_when_its_time_budget_is_over(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, time_budget=60)
+        with mock.patch.object(CleanUPThrottle, 'is_expired', return_value=True):
+            manager = self.cleanup(table)
+        self.assertTrue(manager.stopped)
+        self.assertEqual(table.status, PARTIAL)
+        self.assertEqual(table.logs_deleted, 10)
+        self.assertEqual(CleanUPTestLog.objects.count(), 20)
+
+
+class CleanUPKeysetTests(CleanUPDatabaseTestCase):
+
+    def test_keyset_deletes_the_expired_rows_in_batches(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        manager = self.cleanup(table)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(manager.results[table.table_name]['logs_deleted'], 25)
+        self.assertEqual(table.batches_done, 3)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+        self.assertFalse(CleanUPTestLog.objects.filter(created_at=self.expired_date).exists())
+
+    def test_default_bound_sql_is_portable(self):
+        sql_name = BaseDialect().get_sql_name(CleanUPTableConstants.SQL_KEYSET_BOUND_NAME)
+        with open(os.path.join(os.path.dirname(__file__), sql_name)) as sql_file:
+            sql = sql_file.read()
+        self.assertIn('FETCH NEXT {limit} ROWS ONLY', sql)
+        self.assertNotIn('LIMIT', sql)
+
+
+class CleanUPResumeTests(CleanUPDatabaseTestCase):
+
+    def interrupt(self, table, batches):
+        """
+        Leave the table as a process killed after its first `batches` batches, with the progress of a dead process
+        """
+
+        expired = CleanUPTestLog.objects.filter(created_at=self.expired_date).order_by('pk')
+        watermark = list(expired.values_list('pk', flat=True))[batches * table.batch_size - 1]
+        CleanUPTestLog.objects.filter(pk__lte=watermark).delete()
+        CleanUPTables.objects.filter(pk=table.pk).update(
+            status=CLEANING, watermark=str(watermark), batches_done=batches, logs_deleted=batches * table.batch_size,
+            progress_updated_at=timezone.now() - timedelta(days=1)
+        )
+        table.refresh_from_db()
+        return watermark
+
+    def test_interrupted_table_resumes_from_its_watermark(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        watermark = self.interrupt(table, batches=1)
+        # A row below the watermark that expired after the interruption is left for the next execution
+        CleanUPTestLog.objects.create(id=watermark, created_at=self.expired_date)
+        manager = self.cleanup(table)
+        self.assertTrue(manager.results[table.table_name]['resumed'])
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(table.logs_deleted, 25)
+        self.assertEqual(table.batches_done, 3)
+        self.assertIsNone(table.watermark)
+        self.assertEqual(list(CleanUPTestLog.objects.filter(created_at=self.expired_date).values_list('pk', flat=True)),
+                         [watermark])
+        run = table.runs.get()
+        self.assertTrue(run.resumed)
+        self.assertEqual(run.rows_deleted, 15)
+
+    def test_finished_table_starts_over(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, status=SUCCESS, logs_deleted=40, batches_done=4)
+        manager = self.cleanup(table)
+        self.assertFalse(manager.results[table.table_name]['resumed'])
+        self.assertEqual(table.logs_deleted, 25)
+        self.assertEqual(table.batches_done, 3)
+
+
+class CleanUPIncrementalTests(CleanUPDatabaseTestCase):
+
+    def setUp(self):
+        super(CleanUPIncrementalTests, self).setUp()
+        self.last_cutoff = timezone.now() - timedelta(days=40)
+        self.old_date = timezone.now() - timedelta(days=60)
+
+    def create_incremental_logs(self):
+        self.create_logs(expired=15, recent=5)
+        CleanUPTestLog.objects.bulk_create([CleanUPTestLog(created_at=self.old_date) for _ in range(10)])
+
+    def test_only_the_rows_expired_since_the_last_cutoff_are_deleted(self):
+        self.create_incremental_logs()
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, incremental=True, last_cutoff=self.last_cutoff)
+        self.cleanup(table)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(table.logs_deleted, 15)
+        self.assertEqual(CleanUPTestLog.objects.filter(created_at=self.old_date).count(), 10)
+        self.assertEqual(CleanUPTestLog.objects.filter(created_at=self.expired_date).count(), 0)
+        self.assertGreater(table.last_cutoff, self.expired_date)
+        self.assertLess(table.last_cutoff, self.recent_date)
+
+    def test_first_execution_deletes_every_expired_row(self):
+        self.create_incremental_logs()
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, incremental=True)
+        self.cleanup(table)
+        self.assertEqual(table.logs_deleted, 25)
+        self.assertIsNotNone(table.last_cutoff)
+
+    def test_last_cutoff_is_kept_by_partial_and_resumed_executions(self):
+        self.create_incremental_logs()
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, incremental=True, last_cutoff=self.last_cutoff)
+        with mock.patch.object(CleanUPThrottle, 'is_expired', return_value=True):
+            self.cleanup(table)
+        self.assertEqual(table.status, PARTIAL)
+        self.assertEqual(table.last_cutoff, self.last_cutoff)
+
+        CleanUPTables.objects.filter(pk=table.pk).update(
+            status=CLEANING, progress_updated_at=timezone.now() - timedelta(days=1)
+        )
+        table.refresh_from_db()
+        manager = self.cleanup(table)
+        self.assertTrue(manager.results[table.table_name]['resumed'])
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(table.last_cutoff, self.last_cutoff)
+
+
+class CleanUPRunHistoryTests(CleanUPDatabaseTestCase):
+
+    def test_each_execution_is_kept_in_the_run_history(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        self.cleanup(table)
+        self.create_logs(expired=5, recent=0)
+        self.cleanup(table)
+        first, second = CleanUPRun.objects.filter(table=table).order_by('pk')
+        self.assertEqual((first.status, first.strategy, first.batches, first.rows_deleted), (SUCCESS, KEYSET, 3, 25))
+        self.assertEqual((second.batches, second.rows_deleted), (1, 5))
+        self.assertFalse(first.resumed)
+        self.assertIsNotNone(first.finished_at)
+        self.assertLessEqual(first.p50_batch_seconds, first.p95_batch_seconds)
+        self.assertEqual(first.p95_batch_seconds, first.max_batch_seconds)
+
+    def test_failed_execution_is_kept_with_its_error(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        with mock.patch.object(CleanUPTablesManager, '_delete_range', side_effect=OperationalError('disk full')):
+            self.cleanup(table)
+        run = table.runs.get()
+        self.assertEqual(run.status, ERROR)
+        self.assertEqual(run.errors, 'disk full')
+
+    def test_batch_signals_are_sent_for_each_batch(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        started, finished = mock.Mock(), mock.Mock()
+        batch_started.connect(started)
+        batch_finished.connect(finished)
+        self.addCleanup(batch_started.disconnect, started)
+        self.addCleanup(batch_finished.disconnect, finished)
+        self.cleanup(table)
+        # The last batch finds no rows left, it is started and never finished
+        self.assertEqual(started.call_count, 4)
+        self.assertEqual([call[1]['rows'] for call in finished.call_args_list], [10, 10, 5])
+        arguments = finished.call_args[1]
+        self.assertEqual(arguments['table'].pk, table.pk)
+        self.assertEqual((arguments['strategy'], arguments['batch_size']), (KEYSET, 10))
+        self.assertGreaterEqual(arguments['seconds'], 0)
+
+
+class CleanUPDryRunTests(CleanUPDatabaseTestCase):
+
+    def plan(self, table):
+        manager = CleanUPTablesManager(instance_id=table.pk, user_id=self.user.pk, dry_run=True)
+        manager.cleanup()
+        return manager.plans[table.table_name]
+
+    def test_dry_run_explains_the_first_batch_without_deleting(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        plan = self.plan(table)
+        self.assertEqual(plan['strategy'], KEYSET)
+        self.assertIn('MAX(', plan['sql'])
+        self.assertIsNone(plan['errors'])
+        self.assertTrue(plan['scans'])
+        self.assertTrue(plan['full_scan'])
+        self.assertTrue(plan['warnings'])
+        self.assertEqual(CleanUPTestLog.objects.count(), 30)
+        self.assertFalse(table.runs.exists())
+
+    def test_index_on_the_date_field_avoids_the_full_scan(self):
+        table = self.create_table(CleanUPTestLog, strategy=LEGACY)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE INDEX cleanup_tables_cleanuptestlog_dry_run ON cleanup_tables_cleanuptestlog '
+                           '(created_at, id)')
+        try:
+            plan = self.plan(table)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('DROP INDEX cleanup_tables_cleanuptestlog_dry_run')
+        self.assertEqual(plan['strategy'], LEGACY)
+        self.assertTrue(plan['sql'].lstrip().startswith('DELETE'))
+        self.assertFalse(plan['full_scan'])
+
+
+class CleanUPMaintenanceTests(CleanUPDatabaseTestCase):
+
+    def test_table_is_maintained_when_most_rows_are_deleted(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, maintenance_threshold=0.5)
+        self.cleanup(table)
+        self.assertIsNotNone(table.maintenance_seconds)
+        self.assertEqual(table.runs.get().maintenance_seconds, table.maintenance_seconds)
+
+    def test_space_is_reclaimed_when_the_table_asks_for_it(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, maintenance_threshold=0.5, reclaim_space=True)
+        execute_statement = CleanUPTablesManager._execute_statement
+        with mock.patch.object(CleanUPTablesManager, '_execute_statement', autospec=True,
+                               side_effect=execute_statement) as statements:
+            self.cleanup(table)
+        self.assertIn('VACUUM', [call[0][1] for call in statements.call_args_list])
+        self.assertIsNotNone(table.maintenance_seconds)
+
+    def test_table_is_not_maintained_below_its_threshold(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, maintenance_threshold=0.5)
+        with mock.patch.object(CleanUPTablesManager, '_get_live_rows', return_value=1000):
+            self.cleanup(table)
+        self.assertIsNone(table.maintenance_seconds)
+
+    def test_table_without_threshold_is_not_maintained(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        self.cleanup(table)
+        self.assertIsNone(table.maintenance_seconds)
+
+
+class CleanUPSqlFileFormTests(SimpleTestCase):
+
+    def clean_sql_file(self, content):
+        form = CleanUPTablesForm()
+        form.cleaned_data = {'sql_file': SimpleUploadedFile('cleanup.sql', content)}
+        return form.clean_sql_file()
+
+    def test_bind_parameters_and_escaped_percent_are_accepted(self):
+        sql_file = self.clean_sql_file(b"DELETE FROM {db_table_name} WHERE {db_condition} AND name LIKE 'a%%' "
+                                       b"AND id < %(upper_bound)s LIMIT {limit}")
+        self.assertTrue(sql_file.read().startswith(b'DELETE'))
+
+    def test_literal_percent_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            self.clean_sql_file(b"DELETE FROM {db_table_name} WHERE {db_condition} AND name LIKE 'a%'")
+
+
+class CleanUPDialectTests(CleanUPDatabaseTestCase):
+
+    def test_legacy_runs_the_batch_delete_of_the_backend(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=LEGACY)
+        manager = self.cleanup(table)
+        self.assertEqual(manager.strategy, LEGACY)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(table.logs_deleted, 25)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+    def test_backends_without_dialect_use_the_default_sql(self):
+        self.assertIsInstance(get_dialect('oracle'), BaseDialect)
+        self.assertEqual(get_dialect('oracle').get_sql_name(CleanUPTableConstants.SQL_NAME),
+                         CleanUPTableConstants.SQL_NAME)
+        self.assertEqual(get_dialect('sqlite').get_sql_name(CleanUPTableConstants.SQL_NAME),
+                         'sql/sqlite/cleanup_process.sql')
+
+
+
+class CleanUPBatchTimeoutTests(CleanUPDatabaseTestCase):
+
+    def get_manager(self, vendor, **kwargs):
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, **kwargs)
+        manager = CleanUPTablesManager(instance_id=table.pk, user_id=self.user.pk)
+        manager._set_table_database(table)
+        manager._prepare_environment(table)
+        manager.dialect = get_dialect(vendor)
+        return manager
+
+    def run_batch(self, manager, err=None):
+        with mock.patch.object(CleanUPTablesManager, '_execute_statement') as execute_statement, \
+                mock.patch.object(CleanUPTablesManager, '_get_backoff', return_value=0):
+            with manager._batch_transaction():
+                if err is not None:
+                    raise err
+        return [call[0][0] for call in execute_statement.call_args_list]
+
+    def test_postgresql_timeouts_last_for_the_transaction(self):
+        manager = self.get_manager('postgresql')
+        self.assertEqual(self.run_batch(manager), [
+            'SET LOCAL lock_timeout = 5000',
+            'SET LOCAL statement_timeout = 60000',
+        ])
+
+    def test_mysql_session_timeout_is_restored_after_the_batch(self):
+        manager = self.get_manager('mysql')
+        restore = 'SET SESSION innodb_lock_wait_timeout = @cleanup_tables_lock_wait_timeout'
+        statements = self.run_batch(manager)
+        self.assertIn('SESSION innodb_lock_wait_timeout = 5', statements[0])
+        self.assertEqual(statements[1:], [restore])
+        with mock.patch.object(BaseDialect, 'is_transient', return_value=True):
+            self.assertEqual(self.run_batch(manager, OperationalError('Lock wait timeout exceeded'))[-1], restore)
+        self.assertTrue(manager.retry_batch)
+
+    def test_timed_out_batch_is_retried_with_a_smaller_size(self):
+        manager = self.get_manager('postgresql', batch_size=100, min_batch_size=1, max_batch_size=100)
+        with mock.patch.object(BaseDialect, 'is_timeout', return_value=True), \
+                mock.patch.object(BaseDialect, 'is_transient', return_value=True):
+            self.run_batch(manager, OperationalError('canceling statement due to lock timeout'))
+        self.assertTrue(manager.retry_batch)
+        self.assertLess(manager.batch_size.size, 100)
+        self.assertEqual(manager.retries, 1)
+
+
+class AdaptiveBatchSizeTests(SimpleTestCase):
+
+    def setUp(self):
+        self.batch_size = AdaptiveBatchSize(size=1000, min_size=100, max_size=4000, target_seconds=1.0)
+
+    def test_fast_batch_grows_at_most_max_growth(self):
+        self.assertEqual(self.batch_size.update(1000, 0.1), 2000)
+
+    def test_slow_batch_shrinks_at_most_max_shrink(self):
+        self.assertEqual(self.batch_size.update(1000, 10), 500)
+
+    def test_batch_on_target_keeps_the_size(self):
+        self.assertEqual(self.batch_size.update(1000, 1.0), 1000)
+
+    def test_partial_batch_does_not_grow(self):
+        self.assertEqual(self.batch_size.update(10, 0.01), 1000)
+
+    def test_size_stays_between_the_bounds(self):
+        for _ in range(5):
+            self.batch_size.update(self.batch_size.size, 0.01)
+        self.assertEqual(self.batch_size.size, 4000)
+        for _ in range(10):
+            self.batch_size.shrink()
+        self.assertEqual(self.batch_size.size, 100)
+
+
+
+
+class CleanUPBatchSizeTests(CleanUPDatabaseTestCase):
+
+    def test_next_execution_starts_from_the_size_reached(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, batch_size=10, max_batch_size=40)
+        with mock.patch.object(AdaptiveBatchSize, 'update', autospec=True,
+                               side_effect=lambda batch_size, rows, seconds: setattr(batch_size, 'size', 20)):
+            self.cleanup(table)
+        self.assertEqual(table.batch_size, 20)
+        self.assertEqual(table.batches_done, 2)
+
+
+class SplitPrimaryKeyRangeTests(SimpleTestCase):
+
+    def test_slices_cover_the_range_without_overlapping(self):
+        slices = CleanUPTablesManager._split_primary_key_range(1, 10, 3)
+        self.assertEqual([(_slice['low'], _slice['high']) for _slice in slices], [(0, 4), (4, 8), (8, 10)])
+
+    def test_more_slices_than_keys(self):
+        slices = CleanUPTablesManager._split_primary_key_range(5, 6, 4)
+        self.assertEqual([(_slice['low'], _slice['high']) for _slice in slices], [(4, 5), (5, 6)])
+
+
+
+
+class CleanUPSlicesTests(CleanUPDatabaseTestCase):
+
+    def test_slices_delete_the_expired_rows_of_their_range(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, parallelism=3)
+        manager = self.cleanup(table)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(len(manager.slices), 3)
+        self.assertEqual(sum(_slice['logs_deleted'] for _slice in manager.slices), 25)
+        self.assertTrue(all(_slice['completion'] == 100 for _slice in manager.slices))
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+
+
+class CleanUPConcurrencyTests(CleanUPDatabaseTestCase):
+
+    def test_database_without_workers_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            CleanUPTablesManager(max_workers=2, max_workers_per_database={'default': 0})
+
+    def test_command_rejects_zero_workers(self):
+        with self.assertRaises(CommandError):
+            call_command('cleanup_tables', '--max-workers', '0')
+
+    def test_tables_that_can_never_start_are_deferred(self):
+        self.create_logs(expired=5, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        manager = CleanUPTablesManager(user_id=self.user.pk, max_workers=2)
+        manager.max_workers_per_database = {'default': 0}
+        manager._cleanup_concurrently([(table, 'default')], 2)
+        table.refresh_from_db()
+        self.assertIn(table.table_name, manager.deferred)
+        self.assertTrue(table.deferred_reason)
+        self.assertEqual(CleanUPTestLog.objects.count(), 10)
+
+
+
+class CleanUPRoutingTests(CleanUPDatabaseTestCase):
+
+    def test_table_is_cleaned_in_the_database_of_its_router(self):
+        with override_settings(DATABASE_ROUTERS=['cleanup_tables.tests.CleanUPTestEventRouter']):
+            self.assertEqual(CleanUPTablesManager._db_alias(CleanUPTestEvent), 'events')
+            self.assertEqual(CleanUPTablesManager._db_alias(CleanUPTestLog), 'default')
+
+    def test_tables_of_different_databases_are_cleaned_at_the_same_time(self):
+        log_table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        event_table = self.create_table(CleanUPTestEvent, strategy=KEYSET)
+        manager = CleanUPTablesManager(user_id=self.user.pk)
+        with override_settings(DATABASE_ROUTERS=['cleanup_tables.tests.CleanUPTestEventRouter']), \
+                mock.patch.object(CleanUPTablesManager, '_cleanup_concurrently') as cleanup_concurrently:
+            manager.cleanup()
+        tables, max_workers = cleanup_concurrently.call_args[0]
+        self.assertEqual(sorted((table.pk, alias) for table, alias in tables),
+                         [(log_table.pk, 'default'), (event_table.pk, 'events')])
+        self.assertEqual(max_workers, 2)
+
+    def test_tables_of_one_database_are_cleaned_one_after_another(self):
+        self.create_logs(expired=25, recent=5)
+        self.create_table(CleanUPTestLog, strategy=KEYSET)
+        self.create_table(CleanUPTestEvent, strategy=KEYSET)
+        manager = CleanUPTablesManager(user_id=self.user.pk)
+        with mock.patch.object(CleanUPTablesManager, '_cleanup_concurrently') as cleanup_concurrently:
+            manager.cleanup()
+        cleanup_concurrently.assert_not_called()
+        self.assertEqual(sorted(manager.results), ['CleanUPTestEvent', 'CleanUPTestLog'])
+
+
+@override_settings(CLEANUP_TABLES_TASK_BACKEND='cleanup_tables.tasks.ImmediateTaskBackend')
+class CleanUPAdminTests(CleanUPDatabaseTestCase):
+
+    def test_admin_action_cleans_the_table_in_the_task_backend(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        request = RequestFactory().post('/')
+        request.user = self.user
+        with mock.patch('cleanup_tables.admin.messages') as messages:
+            CleanUPTablesAdmin(CleanUPTables, admin.site).launch_cleanup_process(
+                request, CleanUPTables.objects.filter(pk=table.pk)
+            )
+        messages.success.assert_called_once()
+        table.refresh_from_db()
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(table.updated_by, self.user)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+    @override_settings(CLEANUP_TABLES_PROGRESS_SECONDS=3600)
+    def test_progress_is_saved_while_the_table_is_cleaned(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        progress = []
+
+        def save_progress(**kwargs):
+            progress.append(CleanUPTables.objects.values_list('status', 'logs_deleted', 'watermark').get(pk=table.pk))
+
+        batch_started.connect(save_progress)
+        self.addCleanup(batch_started.disconnect, save_progress)
+        self.cleanup(table)
+        # The first batch is saved, the next ones within the `progress_seconds` of the last save are not
+        self.assertEqual(progress[0], (CLEANING, 0, None))
+        self.assertEqual(progress[1][:2], (CLEANING, 10))
+        self.assertIsNotNone(progress[1][2])
+        self.assertEqual(progress[-1][:2], (CLEANING, 10))
+
+    def test_progress_of_the_table_in_execution(self):
+        table = CleanUPTables(status=CLEANING, logs_deleted=10, estimated_rows=30, current_rows_per_second=5)
+        model_admin = CleanUPTablesAdmin(CleanUPTables, admin.site)
+        self.assertEqual(model_admin.progress(table), '10 of ~30 rows, 5 rows/s, ETA 0:00:04')
+        table.status = SUCCESS
+        self.assertEqual(model_admin.progress(table), '-')
+
+
+class CleanUPCommandTests(CleanUPDatabaseTestCase):
+
+    def test_command_cleans_the_table(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        stdout = StringIO()
+        with override_settings(USERNAME_BY_DEFAULT=self.user.username):
+            call_command('cleanup_tables', '--table', str(table.pk), '--force', stdout=stdout)
+        self.assertIn('{0}: {1}, 25 rows deleted'.format(table.table_name, SUCCESS), stdout.getvalue())
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+    def test_table_cleaned_by_another_process_is_deferred(self):
+        """
+        SQLite has no advisory locks, the table in cleaning status with a recent progress belongs to a live process
+        """
+
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, status=CLEANING,
+                                  progress_updated_at=timezone.now())
+        manager = self.cleanup(table)
+        self.assertIn(table.table_name, manager.deferred)
+        self.assertEqual(table.status, CLEANING)
+        self.assertEqual(CleanUPTestLog.objects.count(), 30)
+
+    def test_table_of_a_dead_process_is_resumed(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, status=CLEANING,
+                                  progress_updated_at=timezone.now() - timedelta(days=1))
+        manager = self.cleanup(table)
+        self.assertTrue(manager.results[table.table_name]['resumed'])
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+    def test_status_claimed_is_restored_when_the_table_is_not_cleaned(self):
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        manager = CleanUPTablesManager(instance_id=table.pk, user_id=self.user.pk)
+        manager._set_table_database(table)
+        self.assertTrue(manager._acquire_lock(table))
+        self.assertFalse(CleanUPTablesManager(user_id=self.user.pk)._claim_table(table))
+        manager._release_lock(table)
+        table.refresh_from_db()
+        self.assertEqual(table.status, NEW)
+
+
+
+@override_settings(CLEANUP_TABLES_TASK_BACKEND='cleanup_tables.tasks.ImmediateTaskBackend')
+class CleanUPIndexTests(CleanUPDatabaseTestCase):
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS cleanup_tables_cleanuptestlog_created_at_cleanup')
+        super(CleanUPIndexTests, self).tearDown()
+
+    def test_missing_index_is_built_and_the_table_deferred(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, auto_index=True)
+        manager = self.cleanup(table)
+        self.assertIn(table.table_name, manager.deferred)
+        self.assertEqual(table.index_status, INDEX_VALID)
+        self.assertEqual(CleanUPTestLog.objects.count(), 30)
+        self.cleanup(table)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+    def test_index_of_a_dead_build_is_built_again(self):
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, auto_index=True, index_status=INDEX_BUILDING,
+                                  index_updated_at=timezone.now() - timedelta(days=1))
+        self.cleanup(table)
+        self.assertEqual(table.index_status, INDEX_VALID)
+
+    def test_index_of_a_live_build_is_not_enqueued_again(self):
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, auto_index=True, index_status=INDEX_BUILDING,
+                                  index_updated_at=timezone.now())
+        with mock.patch('cleanup_tables.core.get_task_backend') as get_task_backend:
+            manager = self.cleanup(table)
+        get_task_backend.assert_not_called()
+        self.assertIn(table.table_name, manager.deferred)
+        self.assertEqual(table.index_status, INDEX_BUILDING)
+
+
+
+class CleanUPWindowTests(CleanUPDatabaseTestCase):
+
+    def test_table_scheduled_after_an_overrun_is_deferred(self):
+        first = self.create_table(CleanUPTestLog, strategy=KEYSET, backlog_rows=100, rows_per_second=20)
+        second = self.create_table(CleanUPTestEvent, strategy=KEYSET, backlog_rows=100, rows_per_second=10)
+        manager = CleanUPTablesManager(user_id=self.user.pk, window=1000)
+        started = []
+
+        def overrun(table):
+            started.append(table)
+            manager.window_deadline = time.monotonic() + 10
+
+        with mock.patch.object(manager, '_cleanup_table', side_effect=overrun):
+            manager.cleanup()
+        self.assertEqual(started, [first])
+        second.refresh_from_db()
+        self.assertIn('took longer than planned', manager.deferred[second.table_name])
+        self.assertEqual(second.deferred_reason, manager.deferred[second.table_name])
+
+
+class CleanUPArchiveTests(CleanUPDatabaseTestCase):
+
+    def test_keyset_archives_each_row_once(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, archive_format=JSONL)
+        self.cleanup(table)
+        archived_ids = self.get_archived_ids(table)
+        self.assertEqual(len(archived_ids), 25)
+        self.assertEqual(len(set(archived_ids)), 25)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+    def test_archived_legacy_table_uses_the_keyset_strategy(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=LEGACY, archive_format=JSONL)
+        manager = self.cleanup(table)
+        self.assertEqual(manager.strategy, KEYSET)
+        self.assertEqual(len(self.get_archived_ids(table)), 25)
+
+    def test_rotates_the_files(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, archive_format=JSONL)
+        with mock.patch.object(CleanUPTablesManager, 'ARCHIVE_FILE_ROWS', 10):
+            self.cleanup(table)
+        self.assertEqual(sorted(table.archives.values_list('rows', flat=True)), [5, 10, 10])
+
+
+class CleanUPBatchRetryTests(CleanUPDatabaseTestCase):
+
+    def setUp(self):
+        super(CleanUPBatchRetryTests, self).setUp()
+        self.delete_range = CleanUPTablesManager._delete_range
+        self.attempts = 0
+
+    def fail_second_batch(self, manager, watermark_condition, params):
+        """
+        Delete the range and fail the second batch after it, so its rows are deleted and archived before the rollback
+        """
+
+        self.delete_range(manager, watermark_condition, params)
+        self.attempts += 1
+        if self.attempts == 2:
+            raise OperationalError('database is locked')
+
+    def cleanup_with_retry(self, table):
+        with mock.patch.object(BaseDialect, 'is_transient', return_value=True), \
+                mock.patch.object(CleanUPTablesManager, '_get_backoff', return_value=0), \
+                mock.patch.object(CleanUPTablesManager, '_delete_range', autospec=True,
+                                  side_effect=self.fail_second_batch):
+            return self.cleanup(table)
+
+    def test_retried_batch_is_counted_once(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        manager = self.cleanup_with_retry(table)
+        self.assertEqual(self.attempts, 4)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(manager.results[table.table_name]['retries'], 1)
+        self.assertEqual(table.logs_deleted, 25)
+        self.assertEqual(table.batches_done, 3)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+    def test_retried_batch_is_archived_once(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, archive_format=JSONL)
+        self.cleanup_with_retry(table)
+        archived_ids = self.get_archived_ids(table)
+        self.assertEqual(len(archived_ids), 25)
+        self.assertEqual(len(set(archived_ids)), 25)
+
+    def test_non_transient_error_fails_the_table(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        with mock.patch.object(BaseDialect, 'is_transient', return_value=False), \
+                mock.patch.object(CleanUPTablesManager, '_delete_range', autospec=True,
+                                  side_effect=self.fail_second_batch):
+            manager = self.cleanup(table)
+        self.assertEqual(table.status, ERROR)
+        self.assertEqual(manager.results[table.table_name]['retries'], 0)
+        self.assertEqual(table.logs_deleted, 10)
+        self.assertEqual(CleanUPTestLog.objects.count(), 20)
+
+    def test_failed_bound_query_is_retried(self):
+        fetch_value = CleanUPTablesManager._fetch_value
+
+        def fail_first_bound(manager, sql, params=None):
+            if 'MAX(' in sql and not self.attempts:
+                self.attempts += 1
+                raise OperationalError('database is locked')
+            return fetch_value(manager, sql, params)
+
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        with mock.patch.object(BaseDialect, 'is_transient', return_value=True), \
+                mock.patch.object(CleanUPTablesManager, '_get_backoff', return_value=0), \
+                mock.patch.object(CleanUPTablesManager, '_fetch_value', autospec=True, side_effect=fail_first_bound):
+            manager = self.cleanup(table)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(manager.results[table.table_name]['retries'], 1)
+        self.assertEqual(table.batches_done, 3)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+
+
+class CleanUPMoveTests(CleanUPDatabaseTestCase):
+
+    archive_table = 'cleanup_tables_cleanuptestlog_archive'
+
+    def setUp(self):
+        super(CleanUPMoveTests, self).setUp()
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE {0} (id integer PRIMARY KEY, created_at timestamp)'.format(self.archive_table))
+        self.addCleanup(self.drop_archive_table)
+
+    def drop_archive_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE {0}'.format(self.archive_table))
+
+    def get_archived_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM {0} ORDER BY id'.format(self.archive_table))
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_expired_rows_are_moved_to_the_archive_table(self):
+        self.create_logs(expired=25, recent=5)
+        expired_ids = list(CleanUPTestLog.objects.filter(created_at=self.expired_date).order_by('pk').values_list(
+            'pk', flat=True
+        ))
+        table = self.create_table(CleanUPTestLog, strategy=MOVE, archive_table=self.archive_table)
+        manager = self.cleanup(table)
+        self.assertEqual(manager.strategy, MOVE)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(table.logs_deleted, 25)
+        self.assertEqual(table.batches_done, 3)
+        self.assertEqual(self.get_archived_rows(), expired_ids)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+    def test_failed_move_keeps_the_rows_in_the_table(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=MOVE, archive_table=self.archive_table)
+        with mock.patch.object(CleanUPTablesManager, '_execute_sql', side_effect=OperationalError('disk full')):
+            self.cleanup(table)
+        self.assertEqual(table.status, ERROR)
+        self.assertEqual(self.get_archived_rows(), [])
+        self.assertEqual(CleanUPTestLog.objects.count(), 30)
+
+
+class CleanUPCascadeTests(CleanUPDatabaseTestCase):
+
+    def test_cascade_follows_the_on_delete_of_the_dependents(self):
+        expired = CleanUPTestEvent.objects.create(created_at=self.expired_date)
+        recent = CleanUPTestEvent.objects.create(created_at=self.recent_date)
+        for event in (expired, recent):
+            CleanUPTestEventDetail.objects.create(event=event)
+            CleanUPTestEventNote.objects.create(event=event)
+        table = self.create_table(CleanUPTestEvent, strategy=LEGACY)
+        manager = self.cleanup(table)
+        self.assertEqual(manager.strategy, KEYSET)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(list(CleanUPTestEvent.objects.all()), [recent])
+        self.assertEqual(list(CleanUPTestEventDetail.objects.values_list('event', flat=True)), [recent.pk])
+        self.assertEqual(
+            sorted(CleanUPTestEventNote.objects.values_list('event', flat=True), key=lambda pk: pk or 0),
+            [None, recent.pk]
+        )
+
+    def test_unsupported_on_delete_is_rejected(self):
+        field = CleanUPTestEventNote._meta.get_field('event')
+        with mock.patch.object(field.remote_field, 'on_delete', models.SET_DEFAULT):
+            with self.assertRaises(CascadeException):
+                CleanUPCascadeMixin.validate_dependents(CleanUPTestEvent)
+        CleanUPCascadeMixin.validate_dependents(CleanUPTestEvent)
+
+
+class CleanUPEstimateTests(CleanUPDatabaseTestCase):
+
+    def test_fresh_manager_estimates_the_expired_rows(self):
+        """
+        The PostgreSQL estimate explains the batch condition with the bind parameters of the table, it runs on
+        SQLite with the plan returned by the database replaced
+        """
+
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        manager = CleanUPTablesManager(instance_id=table.pk, user_id=self.user.pk)
+        manager._set_table_database(table)
+        plan = [{'Plan': {'Plan Rows': 25}}]
+        with mock.patch.object(CleanUPTablesManager, '_estimate_data_to_delete_sqlite', create=True,
+                               new=CleanUPTablesManager._estimate_data_to_delete_postgresql), \
+                mock.patch.object(CleanUPTablesManager, '_fetch_value', return_value=plan) as fetch_value:
+            manager._prepare_environment(table)
+        self.assertEqual(manager.estimated_rows, 25)
+        self.assertEqual(fetch_value.call_args[0][1]['limit'], 10)
+
+    def test_mysql_estimate_is_the_expired_range(self):
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET)
+        manager = CleanUPTablesManager(instance_id=table.pk, user_id=self.user.pk)
+        manager._set_table_database(table)
+        manager._prepare_environment(table)
+        plan = json.dumps({'query_block': {'table': {'rows_examined_per_scan': 100, 'rows_produced_per_join': 25}}})
+        with mock.patch.object(CleanUPTablesManager, '_fetch_value', return_value=plan) as fetch_value:
+            self.assertEqual(manager._estimate_data_to_delete_mysql(), 25)
+        self.assertTrue(fetch_value.call_args[0][0].startswith('EXPLAIN FORMAT=JSON SELECT'))
+
+
+
+class CleanUPPartitionTests(CleanUPDatabaseTestCase):
+
+    def get_manager(self, **kwargs):
+        table = self.create_table(CleanUPTestLog, strategy=PARTITION, **kwargs)
+        manager = CleanUPTablesManager(instance_id=table.pk, user_id=self.user.pk)
+        manager._set_table_database(table)
+        manager._prepare_environment(table)
+        manager.dialect = get_dialect('postgresql')
+        return manager
+
+    def remove_partition(self, manager, has_default_partition):
+        with mock.patch.object(CleanUPTablesManager, '_has_default_partition', return_value=has_default_partition), \
+                mock.patch.object(CleanUPTablesManager, '_execute_statement') as execute_statement:
+            manager._remove_partition('log_2020')
+        return [call[0][0] for call in execute_statement.call_args_list]
+
+    def test_partition_is_detached_concurrently_and_dropped(self):
+        manager = self.get_manager()
+        self.assertEqual(self.remove_partition(manager, has_default_partition=False), [
+            'ALTER TABLE cleanup_tables_cleanuptestlog DETACH PARTITION log_2020 CONCURRENTLY',
+            'DROP TABLE log_2020',
+        ])
+
+    def test_table_with_default_partition_detaches_with_lock_timeout(self):
+        manager = self.get_manager(partition_action=DETACH)
+        self.assertEqual(self.remove_partition(manager, has_default_partition=True), [
+            'SET LOCAL lock_timeout = 5000',
+            'ALTER TABLE cleanup_tables_cleanuptestlog DETACH PARTITION log_2020',
+        ])
+
+    def test_only_partitions_before_the_cleanup_date_are_expired(self):
+        manager = self.get_manager()
+        partitions = [
+            ('log_2020', "FOR VALUES FROM ('2020-01-01') TO ('2020-02-01')", 10),
+            ('log_current', "FOR VALUES FROM ('2020-02-01') TO ('{0}')".format(timezone.now().year + 1), 20),
+            ('log_default', 'DEFAULT', 5),
+        ]
+        with mock.patch.object(CleanUPTablesManager, '_fetch_all', return_value=partitions):
+            self.assertEqual(manager._get_expired_partitions(), [('log_2020', 10)])
+
+    def test_rows_of_the_boundary_partition_are_deleted_by_keyset(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=PARTITION)
+        with mock.patch.object(CleanUPTablesManager, '_is_partitioned_by_date_field', return_value=True), \
+                mock.patch.object(CleanUPTablesManager, '_get_expired_partitions', return_value=[('log_2020', 40)]), \
+                mock.patch.object(CleanUPTablesManager, '_remove_partition') as remove_partition:
+            self.cleanup(table)
+        remove_partition.assert_called_once_with('log_2020')
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(table.logs_deleted, 65)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+
+class CleanUPSwapTests(CleanUPDatabaseTestCase):
+
+    def test_mostly_expired_table_is_swapped(self):
+        table = self.create_table(CleanUPTestLog, strategy=KEYSET, swap_threshold=0.9)
+        manager = CleanUPTablesManager(instance_id=table.pk, user_id=self.user.pk)
+        manager.estimated_rows = 95
+        with mock.patch.object(CleanUPTablesManager, 'connection', new_callable=mock.PropertyMock) as db_connection, \
+                mock.patch.object(CleanUPTablesManager, '_db_table_rows', return_value=100):
+            db_connection.return_value.vendor = 'postgresql'
+            self.assertTrue(manager._should_swap(table))
+            manager.estimated_rows = 50
+            self.assertFalse(manager._should_swap(table))
+
+    def test_backends_without_swap_use_the_keyset_strategy(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('PostgreSQL swaps the table')
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=SWAP)
+        self.cleanup(table)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(table.batches_done, 3)
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
+
+    @skipUnless(connection.vendor == 'postgresql', 'The swap strategy runs on PostgreSQL')
+    def test_rows_written_during_the_copy_are_kept(self):
+        self.create_logs(expired=25, recent=5)
+        updated = CleanUPTestLog.objects.filter(created_at=self.recent_date).first()
+        deleted = CleanUPTestLog.objects.filter(created_at=self.recent_date).last()
+        copy_rows_to_keep = CleanUPTablesManager._copy_rows_to_keep
+
+        def write_during_copy(manager, shadow_name):
+            rows = copy_rows_to_keep(manager, shadow_name)
+            CleanUPTestLog.objects.create(created_at=self.recent_date)
+            CleanUPTestLog.objects.filter(pk=updated.pk).update(created_at=self.expired_date)
+            CleanUPTestLog.objects.filter(pk=deleted.pk).delete()
+            return rows
+
+        table = self.create_table(CleanUPTestLog, strategy=SWAP)
+        with mock.patch.object(CleanUPTablesManager, '_copy_rows_to_keep', autospec=True,
+                               side_effect=write_during_copy):
+            manager = self.cleanup(table)
+        self.assertEqual(manager.strategy, SWAP)
+        self.assertEqual(table.status, SUCCESS)
+        self.assertEqual(CleanUPTestLog.objects.count(), 4)
+        self.assertFalse(CleanUPTestLog.objects.filter(pk__in=[updated.pk, deleted.pk]).exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'The swap strategy runs on PostgreSQL')
+    def test_tables_with_triggers_are_not_swapped(self):
+        self.create_logs(expired=25, recent=5)
+        table = self.create_table(CleanUPTestLog, strategy=SWAP)
+        with mock.patch.object(CleanUPTablesManager, '_get_swap_blocker', return_value='it has triggers.'), \
+                mock.patch.object(CleanUPTablesManager, '_copy_rows_to_keep') as copy_rows_to_keep:
+            self.cleanup(table)
+        copy_rows_to_keep.assert_not_called()
+        self.assertEqual(CleanUPTestLog.objects.count(), 5)
@@ -0,0 +1,167 @@
+import logging
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BaseProbe(object):
+    """
+    Class to measure a load signal of the database between batches, the cleanup pauses while the value measured is
+    above the threshold. Each backend is measured by its `measure_<vendor>` method, the backends without one are
+    never paused by the probe. A stand-in can override `measure` to test the pacing without the database views.
+    """
+
+    def __init__(self, threshold):
+        """
+        Create an instance with the default values.
+        Args:
+            threshold (float): Highest value allowed to keep deleting
+        """
+
+        self.threshold = threshold
+
+    def measure(self, manager):
+        """
+        Get the current value of the signal
+
+        Args:
+            manager (CleanUPTablesManager): The manager of the table in execution, its cursor runs the queries
+
+        Returns:
+            float: The value measured, None when the database backend can't measure it
+        """
+
+        measure = getattr(self, 'measure_{0}'.format(manager.connection.vendor), None)
+        if measure is None:
+            return None
+        return measure(manager)
+
+    def is_overloaded(self, manager):
+        """
+        Validate if the value measured is above the threshold
+        """
+
+        value = self.measure(manager)
+        return value is not None and value > self.threshold
+
+
+class ReplicationLagProbe(BaseProbe):
+    """
+    Seconds the slowest replica is behind the primary
+    """
+
+    @staticmethod
+    def measure_postgresql(manager):
+        value = manager._fetch_value(
+            'SELECT COALESCE(EXTRACT(EPOCH FROM MAX(replay_lag)), 0) FROM pg_stat_replication'
+        )
+        return float(value or 0)
+
+
+class LockWaitsProbe(BaseProbe):
+    """
+    Sessions of the database waiting for a lock
+    """
+
+    @staticmethod
+    def measure_postgresql(manager):
+        return manager._fetch_value(
+            "SELECT COUNT(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock' AND datname = current_database()"
+        )
+
+    @staticmethod
+    def measure_mysql(manager):
+        return manager._fetch_value("SELECT COUNT(*) FROM information_schema.innodb_trx WHERE trx_state = 'LOCK WAIT'")
+
+
+def get_probes():
+    """
+    Get the probes of settings.CLEANUP_TABLES_PROBES, a list of dicts with the `NAME` of the probe class and its
+    `OPTIONS`, like the AUTH_PASSWORD_VALIDATORS setting
+    """
+
+    return [
+        import_string(probe['NAME'])(**probe.get('OPTIONS', {}))
+        for probe in getattr(settings, 'CLEANUP_TABLES_PROBES', [])
+    ]
+
+
+class CleanUPThrottle(object):
+    """
+    Class to pace the batches of a table: it sleeps between batches to keep the duty cycle, pauses while a probe
+    is overloaded and stops the table when its time budget is over
+    """
+
+    def __init__(self, probes=(), duty_cycle=None, pause_seconds=5, deadline=None):
+        """
+        Create an instance with the default values.
+        Args:
+            probes (list, optional): Probes checked after each batch
+            duty_cycle (float, optional): Fraction of the time spent deleting, between 0 and 1. It sleeps after
+                each batch in proportion to the time the batch took, it doesn't sleep by default.
+            pause_seconds (float, optional): Seconds to wait before checking an overloaded probe again
+            deadline (float, optional): `time.monotonic()` value when the table must stop
+        """
+
+        self.probes = probes
+        self.duty_cycle = duty_cycle
+        self.pause_seconds = pause_seconds
+        self.deadline = deadline
+        self.last_batch_at = time.monotonic()
+
+    def wait(self, manager):
+        """
+        Wait after a committed batch until the next one can start
+
+        Args:
+            manager (CleanUPTablesManager): The manager of the table in execution
+
+        Returns:
+            bool: False when the time budget is over and the table must stop
+        """
+
+        if self.duty_cycle and self.duty_cycle < 1:
+            batch_seconds = time.monotonic() - self.last_batch_at
+            self._sleep(batch_seconds * (1 - self.duty_cycle) / self.duty_cycle)
+
+        while not self.is_expired():
+            probe = self._get_overloaded_probe(manager)
+            if probe is None:
+                self.last_batch_at = time.monotonic()
+                return True
+            logger.info('Cleanup of %s paused by %s', manager._db_table_name(), probe.__class__.__name__)
+            self._sleep(self.pause_seconds)
+        return False
+
+    def is_expired(self):
+        """
+        Validate if the time budget is over
+        """
+
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _get_overloaded_probe(self, manager):
+        """
+        Get the first probe above its threshold. A probe that fails, e.g. without permissions on its view, is skipped.
+        """
+
+        for probe in self.probes:
+            try:
+                if probe.is_overloaded(manager):
+                    return probe
+            except Exception as err:
+                logger.warning('Probe %s failed: %s', probe.__class__.__name__, err)
+        return None
+
+    def _sleep(self, seconds):
+        """
+        Sleep without passing the deadline
+        """
+
+        if self.deadline is not None:
+            seconds = min(seconds, self.deadline - time.monotonic())
+        if seconds > 0:
+            time.sleep(seconds)
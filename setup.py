@@ -14,8 +14,13 @@ INSTALL_REQUIRES = [
     'python-dateutil'
 ]
 PACKAGES = [
-    PACKAGE_NAME
+    PACKAGE_NAME,
+    '{0}.management'.format(PACKAGE_NAME),
+    '{0}.management.commands'.format(PACKAGE_NAME)
 ]
+PACKAGE_DATA = {
+    PACKAGE_NAME: ['sql/*.sql', 'sql/*/*.sql']
+}
 
 setup(
     name=PACKAGE_NAME,
@@ -27,5 +32,6 @@ setup(
     author_email=AUTHOR_EMAIL,
     install_requires=INSTALL_REQUIRES,
     packages=PACKAGES,
+    package_data=PACKAGE_DATA,
     include_package_data=True
 )